@@ -0,0 +1,86 @@
+import re
+import threading
+from bisect import bisect_left
+
+from recipes.models import Ingredient
+
+WORD_START = re.compile(r'(?<=\W)\w')
+
+
+def normalize(value):
+    return value.casefold().replace('ё', 'е')
+
+
+class PrefixIndex:
+    """Sorted ``(key, value)`` pairs searched by key prefix with bisect."""
+
+    def __init__(self, entries):
+        entries = sorted(entries)
+        self.keys = [key for key, value in entries]
+        self.values = [value for key, value in entries]
+
+    def search(self, prefix):
+        keys = self.keys
+        for position in range(bisect_left(keys, prefix), len(keys)):
+            if not keys[position].startswith(prefix):
+                break
+            yield self.values[position]
+
+
+class IngredientAutocomplete:
+    """Per-process autocomplete index over the ingredient catalog.
+
+    Names are matched case-insensitively with ё folded into е. Ingredients
+    whose name starts with the query come first, then those with a later
+    word starting with it, each group in name order. The index is rebuilt
+    when the ingredients catalog version changes.
+    """
+    lock = threading.Lock()
+    current = None
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = {}
+        names = []
+        words = []
+        for ingredient_id, name, measurement_unit in rows:
+            self.rows[ingredient_id] = {
+                'id': ingredient_id,
+                'name': name,
+                'measurement_unit': measurement_unit,
+            }
+            key = normalize(name)
+            names.append((key, ingredient_id))
+            words.extend(
+                (key[match.start():], ingredient_id)
+                for match in WORD_START.finditer(key))
+        self.names = PrefixIndex(names)
+        self.words = PrefixIndex(words)
+
+    @classmethod
+    def get(cls, version):
+        index = cls.current
+        if index is None or index.version != version:
+            with cls.lock:
+                index = cls.current
+                if index is None or index.version != version:
+                    index = cls(version, Ingredient.objects.values_list(
+                        'id', 'name', 'measurement_unit'))
+                    cls.current = index
+        return index
+
+    def search(self, query, limit):
+        query = normalize(query.strip())
+        if not query:
+            return []
+        found = []
+        seen = set()
+        for index in (self.names, self.words):
+            for ingredient_id in index.search(query):
+                if ingredient_id in seen:
+                    continue
+                seen.add(ingredient_id)
+                found.append(self.rows[ingredient_id])
+                if len(found) == limit:
+                    return found
+        return found
@@ -0,0 +1,207 @@
+import hashlib
+import time
+from array import array
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+
+from recipes.models import Tag
+
+
+class ResponseCache:
+    """Shared cache for recipe list and detail responses.
+
+    List pages are keyed by a generation counter that any recipe change
+    bumps, detail pages by a per-recipe version. Entries carry a soft
+    expiry: once it passes, one worker refills the entry while the others
+    keep serving the stale copy instead of all hitting the database.
+    """
+    generation_key = 'recipes:generation'
+
+    def __init__(self):
+        self.cache = caches[settings.RECIPES_CACHE_ALIAS]
+        self.timeout = settings.RECIPES_CACHE_TIMEOUT
+        self.grace = settings.RECIPES_CACHE_GRACE
+
+    def counter(self, key):
+        value = self.cache.get(key)
+        if value is not None:
+            return value
+        # Start from the clock so that a counter evicted from the cache
+        # never reuses the numbers of keys that may still exist.
+        self.cache.add(key, int(time.time() * 1000), None)
+        return self.cache.get(key)
+
+    def bump(self, key):
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.counter(key)
+
+    @staticmethod
+    def request_signature(request):
+        params = sorted(
+            (name, sorted(values))
+            for name, values in request.query_params.lists()
+            if not (name == 'page' and values == ['1'])
+        )
+        source = request.build_absolute_uri('/') + urlencode(params, True)
+        return hashlib.md5(source.encode()).hexdigest()
+
+    def list_key(self, request):
+        return 'recipes:list:{}:{}'.format(
+            self.counter(self.generation_key),
+            self.request_signature(request))
+
+    def detail_key(self, request, pk):
+        return 'recipes:detail:{}:{}:{}'.format(
+            pk,
+            self.counter(f'recipes:version:{pk}'),
+            self.request_signature(request))
+
+    def fetch(self, key, compute):
+        """Return the cached value for ``key`` or store ``compute()``.
+
+        ``compute`` returns a ``(value, cacheable)`` pair; values that are
+        not cacheable (errors) are returned without being stored.
+        """
+        lock_key = f'{key}:lock'
+        entry = self.cache.get(key)
+        if entry is not None:
+            fresh_until, value = entry
+            if fresh_until > time.time() or not self.cache.add(
+                    lock_key, 1, settings.RECIPES_CACHE_LOCK_TIMEOUT):
+                return value
+        elif not self.cache.add(
+                lock_key, 1, settings.RECIPES_CACHE_LOCK_TIMEOUT):
+            entry = self.wait_for(key)
+            if entry is not None:
+                return entry[1]
+        try:
+            value, cacheable = compute()
+            if cacheable:
+                self.cache.set(
+                    key, (time.time() + self.timeout, value),
+                    self.timeout + self.grace)
+            return value
+        finally:
+            self.cache.delete(lock_key)
+
+    def wait_for(self, key):
+        deadline = time.time() + settings.RECIPES_CACHE_LOCK_TIMEOUT
+        while time.time() < deadline:
+            time.sleep(0.05)
+            entry = self.cache.get(key)
+            if entry is not None:
+                return entry
+        return None
+
+    def invalidate(self, ids):
+        self.bump(self.generation_key)
+        for pk in ids:
+            self.bump(f'recipes:version:{pk}')
+
+
+class MembershipCache:
+    """Recipe ids in a user's favorites or cart, author ids they follow.
+
+    Each set is stored as a packed sorted array of 64-bit ids next to the
+    generation of the user's set it was read at. Any change bumps the
+    generation instead of editing the stored set, so every worker sees it
+    on its next read, and a set computed before a concurrent change can
+    never be served after it.
+    """
+    value_fields = {'follow': 'author_id'}
+
+    def __init__(self):
+        self.cache = caches[settings.RECIPES_CACHE_ALIAS]
+        self.timeout = settings.MEMBERSHIP_CACHE_TIMEOUT
+
+    @staticmethod
+    def key(model, user_id):
+        return f'membership:{model._meta.model_name}:{user_id}'
+
+    def get(self, model, user_id):
+        key = self.key(model, user_id)
+        generation_key = f'{key}:generation'
+        entries = self.cache.get_many([key, generation_key])
+        generation = entries.get(generation_key)
+        if generation is None:
+            # Start from the clock, as ResponseCache counters do.
+            self.cache.add(generation_key, int(time.time() * 1000), None)
+            generation = self.cache.get(generation_key)
+        entry = entries.get(key)
+        if entry is not None and entry[0] == generation:
+            ids = array('q')
+            ids.frombytes(entry[1])
+            return set(ids)
+        value_field = self.value_fields.get(
+            model._meta.model_name, 'recipe_id')
+        ids = set(model.objects.filter(
+            user_id=user_id).values_list(value_field, flat=True))
+        self.cache.set(
+            key, (generation, array('q', sorted(ids)).tobytes()),
+            self.timeout)
+        return ids
+
+    def invalidate(self, model, user_id):
+        try:
+            self.cache.incr(f'{self.key(model, user_id)}:generation')
+        except ValueError:
+            # No generation: the next read starts a new one.
+            pass
+
+
+class ShoppingListCache:
+    """Rendered shopping list files, keyed by user and cart ETag.
+
+    A file is stored while it is being streamed to the client, unless it
+    grows past ``SHOPPING_LIST_CACHE_MAX_SIZE``, so at most that much is
+    ever held in memory.
+    """
+
+    def __init__(self):
+        self.cache = caches[settings.RECIPES_CACHE_ALIAS]
+        self.timeout = settings.SHOPPING_LIST_CACHE_TIMEOUT
+
+    @staticmethod
+    def key(user_id, etag):
+        return 'shopping-list:{}:{}'.format(user_id, etag.strip('"'))
+
+    def get(self, user_id, etag):
+        return self.cache.get(self.key(user_id, etag))
+
+    def tee(self, user_id, etag, chunks):
+        """Yield ``chunks`` and store them once all were sent."""
+        buffered = []
+        size = 0
+        for chunk in chunks:
+            if buffered is not None:
+                size += len(chunk)
+                if size <= settings.SHOPPING_LIST_CACHE_MAX_SIZE:
+                    buffered.append(chunk)
+                else:
+                    buffered = None
+            yield chunk
+        if buffered is not None:
+            self.cache.set(
+                self.key(user_id, etag), b''.join(buffered), self.timeout)
+
+
+class TagMap:
+    """Slug to id map of all tags, shared through the recipes cache."""
+    key = 'catalog:tags:map'
+
+    def __init__(self):
+        self.cache = caches[settings.RECIPES_CACHE_ALIAS]
+
+    def get(self):
+        tags = self.cache.get(self.key)
+        if tags is None:
+            tags = dict(Tag.objects.values_list('slug', 'id'))
+            self.cache.set(self.key, tags, settings.TAG_MAP_CACHE_TIMEOUT)
+        return tags
+
+    def invalidate(self):
+        self.cache.delete(self.key)
@@ -0,0 +1,227 @@
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from users.models import Follow
+
+
+class Subscriber:
+    """One open event stream: the viewer's followed authors and a queue.
+
+    The queue is bounded; a subscriber that falls behind is marked as
+    overflowed and disconnected, and catches up on reconnect through
+    ``Last-Event-ID``.
+    """
+
+    def __init__(self, loop, user_id, authors):
+        self.loop = loop
+        self.user_id = user_id
+        self.authors = authors
+        self.queue = asyncio.Queue(settings.EVENTS_CONNECTION_BUFFER)
+        self.overflowed = False
+        self.joined_id = None
+
+    def push(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class EventHub:
+    """In-process pub/sub for recipe events of followed authors.
+
+    Events are published from the request threads once their transaction
+    commits and handed to the subscribers' event loop. The last
+    ``EVENTS_REPLAY_BUFFER`` events are kept for resuming streams. Only
+    streams served by the same process receive an event.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Start from the clock so that ids keep growing across restarts.
+        self.last_id = int(time.time() * 1000)
+        self.history = deque(maxlen=settings.EVENTS_REPLAY_BUFFER)
+        self.by_author = defaultdict(set)
+        self.by_user = defaultdict(set)
+
+    def publish(self, event_type, recipe_id, author_id):
+        with self.lock:
+            self.last_id += 1
+            event = (self.last_id, author_id, json.dumps({
+                'type': event_type, 'recipe': recipe_id, 'author': author_id,
+            }))
+            self.history.append(event)
+            for subscriber in self.by_author.get(author_id, ()):
+                subscriber.loop.call_soon_threadsafe(subscriber.push, event)
+
+    def follow_changed(self, user_id, author_id, following):
+        with self.lock:
+            for subscriber in self.by_user.get(user_id, ()):
+                if following:
+                    subscriber.authors.add(author_id)
+                    self.by_author[author_id].add(subscriber)
+                else:
+                    subscriber.authors.discard(author_id)
+                    self.discard(author_id, subscriber)
+
+    def subscribe(self, subscriber, last_event_id=None):
+        """Register ``subscriber`` and return the events it missed.
+
+        Returns None when the missed events are no longer buffered and the
+        client has to reload its data.
+        """
+        with self.lock:
+            subscriber.joined_id = self.last_id
+            self.by_user[subscriber.user_id].add(subscriber)
+            for author_id in subscriber.authors:
+                self.by_author[author_id].add(subscriber)
+            if last_event_id is None or last_event_id == self.last_id:
+                return []
+            if last_event_id > self.last_id or not self.history or (
+                    last_event_id < self.history[0][0] - 1):
+                return None
+            return [
+                event for event in self.history
+                if event[0] > last_event_id
+                and event[1] in subscriber.authors
+            ]
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            for author_id in subscriber.authors:
+                self.discard(author_id, subscriber)
+            subscribers = self.by_user[subscriber.user_id]
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.by_user[subscriber.user_id]
+
+    def discard(self, author_id, subscriber):
+        subscribers = self.by_author.get(author_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.by_author[author_id]
+
+
+hub = EventHub()
+
+
+def format_event(event):
+    event_id, _, data = event
+    return f'id: {event_id}\nevent: recipe\ndata: {data}\n\n'.encode()
+
+
+@sync_to_async
+def authenticate(key):
+    from rest_framework.authtoken.models import Token
+
+    token = Token.objects.select_related('user').filter(key=key).first()
+    if token is None or not token.user.is_active:
+        return None, None
+    authors = set(Follow.objects.filter(
+        user_id=token.user_id).values_list('author_id', flat=True))
+    return token.user_id, authors
+
+
+async def event_stream(scope, receive, send):
+    """ASGI endpoint streaming recipe events as Server-Sent Events.
+
+    Authenticates with the API token from the ``Authorization`` header or
+    the ``token`` query parameter (``EventSource`` cannot send headers).
+    Sends a ``reset`` event when a stream cannot be resumed from
+    ``Last-Event-ID`` and a comment line every ``EVENTS_HEARTBEAT``
+    seconds while idle.
+    """
+    headers = {
+        name.decode('latin-1'): value.decode('latin-1')
+        for name, value in scope['headers']
+    }
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    key = headers.get('authorization', '').partition('Token ')[2]
+    key = key or query.get('token', [''])[0]
+    user_id, authors = await authenticate(key) if key else (None, None)
+    if user_id is None:
+        await send({
+            'type': 'http.response.start',
+            'status': 401,
+            'headers': [(b'content-type', b'application/json')],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b'{"detail": "Authentication credentials were not '
+                    b'provided."}',
+        })
+        return
+
+    last_event_id = headers.get('last-event-id') or query.get(
+        'last_event_id', [''])[0]
+    last_event_id = int(last_event_id) if last_event_id.isdigit() else None
+    subscriber = Subscriber(asyncio.get_running_loop(), user_id, authors)
+    missed = hub.subscribe(subscriber, last_event_id)
+    disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+    get = None
+    client_gone = False
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        body = b'retry: 3000\n\n'
+        if missed is None:
+            body += (f'id: {subscriber.joined_id}\n'
+                     f'event: reset\ndata: {{}}\n\n').encode()
+        else:
+            body += b''.join(format_event(event) for event in missed)
+        await send({
+            'type': 'http.response.body', 'body': body, 'more_body': True})
+        while True:
+            get = get or asyncio.ensure_future(subscriber.queue.get())
+            done, _ = await asyncio.wait(
+                {get, disconnect}, timeout=settings.EVENTS_HEARTBEAT,
+                return_when=asyncio.FIRST_COMPLETED)
+            client_gone = disconnect in done
+            if client_gone or subscriber.overflowed:
+                break
+            if get in done:
+                body = format_event(get.result())
+                get = None
+            else:
+                body = b': ping\n\n'
+            await send({
+                'type': 'http.response.body', 'body': body,
+                'more_body': True})
+    finally:
+        hub.unsubscribe(subscriber)
+        disconnect.cancel()
+        if get is not None:
+            get.cancel()
+    if not client_gone:
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+def with_event_stream(application):
+    """Serve ``EVENTS_PATH`` from ``event_stream``, the rest from Django."""
+
+    async def router(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == settings.EVENTS_PATH:
+            return await event_stream(scope, receive, send)
+        return await application(scope, receive, send)
+
+    return router
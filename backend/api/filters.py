@@ -1,8 +1,24 @@
-from django_filters import AllValuesMultipleFilter
+from django.contrib.auth import get_user_model
+from django.db.models import Exists, F, OuterRef
 from django_filters.rest_framework import FilterSet, filters
 from django_filters.widgets import BooleanWidget
 
 from recipes.models import Ingredient, Recipe
+from recipes.search import search_recipes
+
+from .cache import TagMap
+from .utils import get_recipe_memberships
+
+User = get_user_model()
+
+
+class TagSlugsFilter(filters.MultipleChoiceFilter):
+    """Multiple tag slugs validated against the cached ``TagMap``."""
+
+    @property
+    def field(self):
+        self.extra['choices'] = [(slug, slug) for slug in TagMap().get()]
+        return super().field
 
 
 class IngredientSearchFilter(FilterSet):
@@ -14,12 +30,87 @@ class IngredientSearchFilter(FilterSet):
 
 
 class RecipeFilter(FilterSet):
-    author = AllValuesMultipleFilter(field_name="author__id")
-    tags = AllValuesMultipleFilter(field_name="tags__slug")
-    is_in_shopping_cart = filters.BooleanFilter(widget=BooleanWidget())
-    is_favorited = filters.BooleanFilter(widget=BooleanWidget())
+    ORDERINGS = {
+        'trending': ('-trending_score', '-id'),
+        'popular': ('-favorites_count', '-id'),
+    }
+
+    author = filters.ModelMultipleChoiceFilter(
+        queryset=User.objects.only('id'), method='filter_author')
+    tags = TagSlugsFilter(method='filter_tags')
+    tags_match = filters.ChoiceFilter(
+        choices=(('any', 'Any tag'), ('all', 'All tags')),
+        method='filter_tags_match')
+    is_in_shopping_cart = filters.BooleanFilter(
+        widget=BooleanWidget(), method='filter_is_in_shopping_cart')
+    is_favorited = filters.BooleanFilter(
+        widget=BooleanWidget(), method='filter_is_favorited')
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('trending', 'Trending'), ('popular', 'Popular')),
+        method='filter_ordering')
 
     class Meta:
         model = Recipe
-        fields = ["author", "tags",
-                  "is_favorited", "is_in_shopping_cart"]
+        fields = ["author", "tags", "tags_match",
+                  "is_favorited", "is_in_shopping_cart", "search", "ordering"]
+
+    def filter_author(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(author_id__in=[user.pk for user in value])
+
+    def filter_tags(self, queryset, name, value):
+        """Keep recipes with any (or all, see ``tags_match``) of the tags.
+
+        Uses EXISTS semi-joins on the through table, so recipes are never
+        duplicated and no DISTINCT is needed.
+        """
+        tags = TagMap().get()
+        tag_ids = {tags[slug] for slug in value if slug in tags}
+        recipe_tags = Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'))
+        if self.form.cleaned_data.get('tags_match') == 'all':
+            for tag_id in tag_ids:
+                queryset = queryset.filter(
+                    Exists(recipe_tags.filter(tag_id=tag_id)))
+            return queryset
+        return queryset.filter(Exists(recipe_tags.filter(tag_id__in=tag_ids)))
+
+    def filter_tags_match(self, queryset, name, value):
+        # Read by filter_tags.
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        # Ranked by relevance unless ``ordering`` is also given.
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*self.ORDERINGS[value])
+
+    def filter_by_membership(self, queryset, relation, recipe_ids, value):
+        """Recipes in (or not in) the viewer's favorites or cart.
+
+        The listing joins from the viewer's own rows, which are indexed by
+        user, and is ordered by when each recipe was added.
+        """
+        user = self.request.user
+        if not value:
+            return queryset.exclude(pk__in=recipe_ids)
+        if user.is_anonymous:
+            return queryset.none()
+        if 'added_at' in queryset.query.annotations:
+            return queryset.filter(pk__in=recipe_ids)
+        return queryset.filter(**{f'{relation}__user': user}).annotate(
+            added_at=F(f'{relation}__added_at')
+        ).order_by('-added_at', '-id')
+
+    def filter_is_favorited(self, queryset, name, value):
+        favorites, shopping_cart = get_recipe_memberships(self.request)
+        return self.filter_by_membership(
+            queryset, 'favorites', favorites, value)
+
+    def filter_is_in_shopping_cart(self, queryset, name, value):
+        favorites, shopping_cart = get_recipe_memberships(self.request)
+        return self.filter_by_membership(
+            queryset, 'shopping_list', shopping_cart, value)
@@ -0,0 +1,70 @@
+import statistics
+import time
+
+import numpy as np
+from django.core.management import BaseCommand
+
+from api.pantry import PantryIndex
+
+
+class Command(BaseCommand):
+    help = ('Measure pantry search latency on a synthetic in-memory index. '
+            'Ingredient popularity follows a Zipf distribution.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--per-recipe', type=int, default=8)
+        parser.add_argument('--pantry', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--page-size', type=int, default=6)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        recipes = options['recipes']
+        per_recipe = options['per_recipe']
+        popularity = 1 / np.arange(1, options['ingredients'] + 1)
+        popularity /= popularity.sum()
+        ingredient_ids = rng.choice(
+            options['ingredients'], size=recipes * per_recipe,
+            p=popularity) + 1
+        recipe_ids = np.repeat(np.arange(1, recipes + 1), per_recipe)
+        # Drop the ingredients drawn twice for the same recipe.
+        pairs = np.unique(recipe_ids.astype(np.int64) << 32 | ingredient_ids)
+        started = time.perf_counter()
+        index = PantryIndex(pairs >> 32, pairs & 0xFFFFFFFF)
+        self.stdout.write(
+            f'Built the index of {recipes} recipes and {len(pairs)} '
+            f'ingredient uses in {time.perf_counter() - started:.2f} s')
+
+        pantries = [
+            rng.choice(
+                options['ingredients'], size=options['pantry'],
+                replace=False, p=popularity) + 1
+            for _ in range(options['repeat'])
+        ]
+        size = options['page_size']
+        for label, max_missing in (
+                ('ranked by coverage', None),
+                ('at most 2 missing', 2),
+                ('all available', 0)):
+            timings = []
+            found = 0
+            for pantry in pantries:
+                started = time.perf_counter()
+                matches = index.search(pantry.tolist(), max_missing)
+                matches[:size]
+                timings.append((time.perf_counter() - started) * 1000)
+                found += len(matches)
+            timings.sort()
+            self.stdout.write(
+                f'{label:>20}: p50 {statistics.median(timings):7.2f} ms '
+                f'p99 {timings[int(len(timings) * 0.99) - 1]:7.2f} ms '
+                f'({found // len(pantries)} matches on average)')
+
+        started = time.perf_counter()
+        for recipe_id in range(1, 101):
+            index.replace(recipe_id, [1, 2, 3])
+        self.stdout.write(
+            f'Incremental update: '
+            f'{(time.perf_counter() - started) * 10:.2f} ms per recipe')
@@ -0,0 +1,104 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+from recipes.search import search_recipes, update_documents
+
+User = get_user_model()
+
+WORDS = (
+    'tomato chicken garlic onion pepper basil lemon honey butter cream '
+    'cheese potato carrot mushroom rice pasta beef salmon spinach ginger '
+    'томат курица чеснок лук перец базилик лимон мёд масло сливки сыр '
+    'картофель морковь гриб рис макароны говядина лосось шпинат имбирь'
+).split()
+QUERIES = (
+    'tomato', 'chicken garlic', 'baked potatoes', 'грибы', 'курица с рисом',
+    'lemon honey ginger', 'сыр', 'salmon',
+)
+
+
+class Command(BaseCommand):
+    help = ('Measure ?search= latency against an icontains scan. Runs on '
+            'seeded data inside a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=500000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=6)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recipes = self.seed(options['recipes'])
+            self.stdout.write(f'Seeded {len(recipes)} recipes')
+            started = time.perf_counter()
+            update_documents(recipes)
+            self.stdout.write(
+                f'Indexed in {time.perf_counter() - started:.1f} s')
+            queryset = Recipe.objects.all()
+            size = options['page_size']
+            for query in QUERIES:
+                search = self.measure(lambda: list(search_recipes(
+                    queryset, query).values_list('pk', flat=True)[:size]),
+                    options['repeat'])
+                scan = self.measure(lambda: list(queryset.filter(
+                    Q(name__icontains=query) | Q(text__icontains=query)
+                ).order_by('-id').values_list('pk', flat=True)[:size]),
+                    options['repeat'])
+                self.stdout.write(
+                    f'{query!r:>24}: search p50 {search[0]:8.2f} ms '
+                    f'p99 {search[1]:8.2f} ms | icontains '
+                    f'p50 {scan[0]:8.2f} ms p99 {scan[1]:8.2f} ms')
+            transaction.set_rollback(True)
+
+    def seed(self, size):
+        rng = random.Random(0)
+        author = User.objects.create(
+            username='bench_search_author',
+            email='bench_search_author@example.com',
+            first_name='Bench',
+            last_name='Author',
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'{word} bench', measurement_unit='g')
+            for word in WORDS
+        )
+        ingredients = list(Ingredient.objects.filter(
+            name__endswith=' bench').values_list('id', flat=True))
+        Recipe.objects.bulk_create((
+            Recipe(
+                author=author,
+                name=' '.join(rng.sample(WORDS, 3)),
+                image='recipes/pizza.jpg',
+                text=' '.join(rng.choices(WORDS, k=40)),
+                cooking_time=i % 90 + 1,
+            ) for i in range(size)
+        ), batch_size=5000)
+        recipes = list(Recipe.objects.filter(
+            author=author).values_list('id', flat=True))
+        RecipeIngredient.objects.bulk_create((
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=1,
+            ) for recipe_id in recipes
+            for ingredient_id in rng.sample(ingredients, 5)
+        ), batch_size=5000)
+        return recipes
+
+    @staticmethod
+    def measure(run, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return (statistics.median(timings),
+                timings[min(len(timings) - 1, int(len(timings) * 0.99))])
@@ -0,0 +1,118 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from api.fast_serializers import RecipeFastReadSerializer
+from api.serializers import RecipeReadSerializer
+from api.views import RecipeViewSet
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Compare RecipeReadSerializer with RecipeFastReadSerializer. '
+            'Runs on seeded data inside a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[6, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        sizes = sorted(options['sizes'])
+        with transaction.atomic():
+            self.seed(sizes[-1])
+            for size in sizes:
+                self.compare(size, options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, size):
+        authors = [
+            User.objects.create(
+                username=f'bench_author_{i}',
+                email=f'bench_author_{i}@example.com',
+                first_name='Bench',
+                last_name=f'Author {i}',
+            ) for i in range(10)
+        ]
+        tags = [
+            Tag.objects.create(
+                name=f'bench tag {i}',
+                color=f'#BE{i:04X}',
+                slug=f'bench-tag-{i}',
+            ) for i in range(4)
+        ]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'bench ingredient {i}', measurement_unit='g')
+            for i in range(30)
+        )
+        ingredients = list(Ingredient.objects.filter(
+            name__startswith='bench ingredient ').values_list('id', flat=True))
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=authors[i % len(authors)],
+                name=f'Bench recipe {i}',
+                image='recipes/pizza.jpg',
+                text='Bench recipe description. ' * 20,
+                cooking_time=i % 90 + 1,
+            ) for i in range(size)
+        )
+        recipes = list(Recipe.objects.filter(
+            author__in=authors).values_list('id', flat=True))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe_id, tag=tags[n % 4])
+            for i, recipe_id in enumerate(recipes) for n in (i, i + 1)
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredients[(i + n) % len(ingredients)],
+                amount=n + 1,
+            ) for i, recipe_id in enumerate(recipes) for n in range(8)
+        )
+
+    def measure(self, render, repeat):
+        with CaptureQueriesContext(connection) as queries:
+            content = render()
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            render()
+            best = min(best, time.perf_counter() - started)
+        return content, best * 1000, len(queries)
+
+    def compare(self, size, repeat):
+        request = Request(RequestFactory().get('/api/recipes/'))
+        request.user = AnonymousUser()
+        view = RecipeViewSet(request=request, format_kwarg=None)
+        renderer = JSONRenderer()
+
+        def render_drf():
+            recipes = view.get_queryset()[:size]
+            return renderer.render(RecipeReadSerializer(
+                recipes, many=True, context={'request': request}).data)
+
+        def render_fast():
+            serializer = RecipeFastReadSerializer(request)
+            rows = list(serializer.rows(view.get_queryset())[:size])
+            return renderer.render(serializer.serialize(rows))
+
+        drf, drf_ms, drf_queries = self.measure(render_drf, repeat)
+        fast, fast_ms, fast_queries = self.measure(render_fast, repeat)
+        if drf != fast:
+            raise CommandError(
+                f'Outputs differ for {size} recipes')
+        self.stdout.write(
+            f'{size:>6} recipes: '
+            f'RecipeReadSerializer {drf_ms:9.2f} ms ({drf_queries} queries)'
+            f' | fast {fast_ms:9.2f} ms ({fast_queries} queries)'
+            f' | x{drf_ms / fast_ms:.1f}'
+        )
@@ -0,0 +1,171 @@
+import hashlib
+
+from django.http import HttpResponse
+from django.utils.http import (http_date, parse_etags, parse_http_date_safe,
+                               quote_etag)
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes.models import CatalogVersion
+
+from .cache import ResponseCache
+from .snapshots import ReferenceSnapshot
+
+
+class ConditionalGetMixin:
+    """Answer list/retrieve with 304 when the client copy is still fresh.
+
+    Views return ``(etag_parts, last_modified)`` from ``get_validators``;
+    the check runs before the queryset is evaluated or serialized.
+    """
+
+    def get_validators(self):
+        return None, None
+
+    def make_etag(self, parts):
+        request = self.request
+        source = '|'.join(str(part) for part in (
+            request.get_full_path(),
+            request.accepted_renderer.format,
+            *parts,
+        ))
+        return quote_etag(hashlib.md5(source.encode()).hexdigest())
+
+    def is_not_modified(self, etag, last_modified):
+        if_none_match = self.request.headers.get('If-None-Match')
+        if if_none_match:
+            return etag in parse_etags(if_none_match)
+        if_modified_since = parse_http_date_safe(
+            self.request.headers.get('If-Modified-Since', ''))
+        return (last_modified is not None and if_modified_since is not None
+                and int(last_modified.timestamp()) <= if_modified_since)
+
+    def conditional(self, handler, request, *args, **kwargs):
+        parts, last_modified = self.get_validators()
+        if parts is None:
+            return handler(request, *args, **kwargs)
+        etag = self.make_etag(parts)
+        if self.is_not_modified(etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (
+                status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(
+                    last_modified.timestamp())
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+
+class CatalogConditionalGetMixin(ConditionalGetMixin):
+    """Validators for read-only catalogs versioned by ``CatalogVersion``."""
+    catalog = None
+
+    def get_catalog(self):
+        if not hasattr(self, '_catalog'):
+            self._catalog = CatalogVersion.get(self.catalog)
+        return self._catalog
+
+    def get_validators(self):
+        catalog = self.get_catalog()
+        return (catalog.name, catalog.version), catalog.updated_at
+
+
+class ReferenceSnapshotMixin:
+    """Serve plain JSON list and retrieve responses of a catalog viewset
+    straight from its ``ReferenceSnapshot``.
+
+    Requests with query parameters or for other renderers go through the
+    serializer. Expects ``get_catalog`` from ``CatalogConditionalGetMixin``.
+    """
+
+    def use_snapshot(self, request):
+        return (request.accepted_renderer.format == 'json'
+                and not request.query_params)
+
+    def snapshot(self):
+        return ReferenceSnapshot.get(self.get_catalog())
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_snapshot(request):
+            return super().list(request, *args, **kwargs)
+        return HttpResponse(
+            self.snapshot().body, content_type='application/json')
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.kwargs[self.lookup_field]
+        if not (self.use_snapshot(request) and pk.isdigit()):
+            return super().retrieve(request, *args, **kwargs)
+        data = self.snapshot().row(int(pk))
+        if data is None:
+            return super().retrieve(request, *args, **kwargs)
+        return HttpResponse(data, content_type='application/json')
+
+
+class SharedCacheMixin:
+    """Serve list and retrieve responses from ``ResponseCache``.
+
+    Cached data is shared by every viewer; ``personalize`` applies the
+    viewer-specific parts to each response. Requests using any of
+    ``private_params`` are never cached.
+    """
+    private_params = ()
+
+    def personalize(self, request, data):
+        return data
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if any(name in request.query_params for name in self.private_params):
+            response = handler(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                self.personalize(request, response.data)
+            return response
+        cache = ResponseCache()
+        if self.action == 'list':
+            key = cache.list_key(request)
+        else:
+            key = cache.detail_key(request, self.kwargs[self.lookup_field])
+        response = None
+
+        def compute():
+            nonlocal response
+            response = handler(request, *args, **kwargs)
+            return (response.data,
+                    response.status_code == status.HTTP_200_OK)
+
+        data = cache.fetch(key, compute)
+        if response is not None and (
+                response.status_code != status.HTTP_200_OK):
+            return response
+        return Response(self.personalize(request, data))
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+
+class CursorPaginationMixin:
+    """Use ``cursor_pagination_class`` when the request carries a cursor.
+
+    Page-number pagination stays the default; ``?cursor=`` opts in.
+    """
+    cursor_pagination_class = None
+
+    @property
+    def paginator(self):
+        cursor_class = self.cursor_pagination_class
+        if (not hasattr(self, '_paginator') and cursor_class is not None
+                and cursor_class.cursor_query_param
+                in self.request.query_params):
+            self._paginator = cursor_class()
+        return super().paginator
@@ -0,0 +1,188 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from recipes.models import FeedEntry, Recipe
+from users.models import Follow
+
+
+class KeysetPagination(BasePagination):
+    """Seek pagination over a unique ``ordering``.
+
+    Pages start right after the boundary row of the previous page instead
+    of at an OFFSET, and no COUNT is run, so a deep page costs the same as
+    the first one. Cursors are opaque tokens holding the boundary values
+    and the direction; an empty ``?cursor=`` opens the first page.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    page_size = api_settings.PAGE_SIZE
+    ordering = ('-id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # An explicit order_by() from the filters, such as a ranking,
+        # replaces the default ordering and must end with a unique field.
+        if queryset.query.order_by:
+            self.ordering = tuple(queryset.query.order_by)
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        position, reverse = self.decode_cursor(request, queryset)
+        rows = self.fetch(queryset, position, reverse)
+        has_more = len(rows) > self.page_size
+        page = rows[:self.page_size]
+        if reverse:
+            page.reverse()
+
+        self.next_position = self.previous_position = None
+        if page:
+            if reverse or has_more:
+                self.next_position = self.get_position(page[-1])
+            if has_more if reverse else position is not None:
+                self.previous_position = self.get_position(page[0])
+        return page
+
+    def fetch(self, queryset, position, reverse, ordering=None):
+        """Up to ``page_size + 1`` rows past ``position``, nearest first.
+
+        ``ordering`` names the queryset columns holding the cursor values
+        when they differ from ``self.ordering``.
+        """
+        ordering = ordering or self.ordering
+        if reverse:
+            queryset = queryset.order_by(*(
+                name[1:] if name.startswith('-') else f'-{name}'
+                for name in ordering
+            ))
+        else:
+            queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(
+                self.seek_filter(position, reverse, ordering))
+        return list(queryset[:self.page_size + 1])
+
+    def seek_filter(self, position, reverse, ordering):
+        """Rows strictly after ``position`` in the requested direction.
+
+        Expands ``(a, b) < (x, y)`` into ``a <= x AND (a < x OR a = x AND
+        b < y)`` so that the leading column can drive an index range scan.
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        field = ordering[0]
+        lookup = 'lte' if field.startswith('-') != reverse else 'gte'
+        return Q(**{f'{field.lstrip("-")}__{lookup}': position[0]}) & condition
+
+    def get_position(self, item):
+        names = [field.lstrip('-') for field in self.ordering]
+        if isinstance(item, dict):
+            return [item[name] for name in names]
+        return [getattr(item, name) for name in names]
+
+    @staticmethod
+    def get_field(queryset, name):
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(name)
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            values = data['p']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = [
+                self.get_field(queryset, field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+            return position, bool(data['r'])
+        except (KeyError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position, reverse):
+        data = json.dumps(
+            {'p': position, 'r': int(reverse)},
+            default=lambda value: value.isoformat(),
+            separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(data.encode()).decode()
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class RecipeKeysetPagination(KeysetPagination):
+    ordering = ('-pub_date', '-id')
+
+
+class SubscriptionKeysetPagination(KeysetPagination):
+    ordering = ('-id',)
+
+
+class FeedPagination(RecipeKeysetPagination):
+    """Keyset pages over the viewer's "following" feed.
+
+    Recipes copied into the viewer's timeline and recipes of followed
+    authors too popular to fan out are read with one seek query each and
+    merged, so a page costs the same however many authors are followed.
+    """
+
+    def fetch(self, queryset, position, reverse, ordering=None):
+        user = self.request.user
+        timeline = FeedEntry.objects.filter(user=user).values_list(
+            'pub_date', 'recipe_id')
+        merged = Recipe.objects.filter(
+            in_timelines=False,
+            author__in=Follow.objects.filter(user=user).values('author'),
+        ).values_list('pub_date', 'id')
+        keys = sorted(
+            set(super().fetch(
+                timeline, position, reverse, ('-pub_date', '-recipe_id')))
+            | set(super().fetch(merged, position, reverse)),
+            reverse=not reverse,
+        )[:self.page_size + 1]
+        recipes = queryset.in_bulk([recipe_id for _, recipe_id in keys])
+        return [
+            recipes[recipe_id] for _, recipe_id in keys
+            if recipe_id in recipes
+        ]
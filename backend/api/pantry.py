@@ -0,0 +1,210 @@
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from recipes.models import Recipe, RecipeIngredient
+
+NO_MATCH = np.iinfo(np.int32).max
+
+
+def coverage_ranks():
+    """Rank and missing count of every ``size << 8 | covered`` pair.
+
+    Ranks order pairs by the covered fraction, then by fewer missing
+    ingredients, best first; pairs covering nothing rank ``NO_MATCH``.
+    """
+    pairs = sorted(
+        ((size, covered) for size in range(1, 256)
+         for covered in range(1, size + 1)),
+        key=lambda pair: (-pair[1] / pair[0], pair[0] - pair[1]))
+    ranks = np.full(1 << 16, NO_MATCH, dtype=np.int32)
+    for rank, (size, covered) in enumerate(pairs):
+        ranks[size << 8 | covered] = rank
+    keys = np.arange(1 << 16)
+    return ranks, np.maximum((keys >> 8) - (keys & 0xFF), 0)
+
+
+class PantryIndex:
+    """Per-process inverted index from ingredient id to recipe ids.
+
+    Every ingredient maps to a sorted ``int32`` array of the recipes using
+    it, and ``sizes`` holds the number of ingredients of every recipe by
+    id (capped at 255). A pantry query counts, with one ``bincount`` over
+    the postings of the given ingredients, how many ingredients of each
+    recipe are covered and ranks the recipes through a table indexed by
+    their size and covered count.
+
+    Recipes saved through ``RecipeWriteSerializer`` are applied to the
+    index of the process that saved them once the transaction commits;
+    other processes pick up recipes updated since their last sync at most
+    ``PANTRY_INDEX_SYNC_INTERVAL`` seconds later. Recipes deleted by other
+    processes are dropped from results when the page is loaded.
+    """
+    lock = threading.Lock()
+    current = None
+    ranks = None
+
+    def __init__(self, recipe_ids, ingredient_ids, synced_at=None):
+        recipe_ids = np.asarray(recipe_ids, dtype=np.int32)
+        ingredient_ids = np.asarray(ingredient_ids, dtype=np.int32)
+        order = np.lexsort((recipe_ids, ingredient_ids))
+        keys, starts = np.unique(ingredient_ids[order], return_index=True)
+        self.postings = dict(zip(
+            keys.tolist(), np.split(recipe_ids[order], starts[1:])))
+        # Ingredients of every recipe as loaded, so that an update does
+        # not scan the postings; later changes are kept in ``changed``.
+        order = np.lexsort((ingredient_ids, recipe_ids))
+        self.base_ingredients = ingredient_ids[order]
+        counts = np.bincount(recipe_ids)
+        self.base_starts = np.concatenate(([0], np.cumsum(counts)))
+        self.changed = {}
+        self.sizes = np.minimum(counts, 255).astype(np.uint8)
+        self.synced_at = synced_at
+        self.checked_at = time.monotonic()
+        if PantryIndex.ranks is None:
+            PantryIndex.ranks = coverage_ranks()
+
+    @classmethod
+    def load(cls):
+        synced_at = Recipe.objects.order_by('-updated_at').values_list(
+            'updated_at', flat=True).first()
+        # A single query: a separate count could disagree with the rows
+        # read when recipes change in between.
+        pairs = np.fromiter(
+            (value for pair in RecipeIngredient.objects.values_list(
+                'recipe_id', 'ingredient_id').iterator(chunk_size=10000)
+             for value in pair),
+            dtype=np.int32)
+        return cls(pairs[0::2], pairs[1::2], synced_at)
+
+    @classmethod
+    def get(cls):
+        index = cls.current
+        if index is None:
+            with cls.lock:
+                index = cls.current
+                if index is None:
+                    index = cls.current = cls.load()
+        elif (time.monotonic() - index.checked_at
+              > settings.PANTRY_INDEX_SYNC_INTERVAL):
+            index.sync()
+        return index
+
+    @classmethod
+    def update_recipe(cls, recipe_id, ingredient_ids):
+        """Apply a committed recipe change to this process's index."""
+        index = cls.current
+        if index is not None:
+            with cls.lock:
+                index.replace(recipe_id, ingredient_ids)
+
+    def sync(self):
+        with self.lock:
+            if (time.monotonic() - self.checked_at
+                    <= settings.PANTRY_INDEX_SYNC_INTERVAL):
+                return
+            self.checked_at = time.monotonic()
+            changed = Recipe.objects.order_by('updated_at')
+            if self.synced_at is not None:
+                # Recipes saved within the same instant are read again.
+                changed = changed.filter(updated_at__gte=self.synced_at)
+            changed = list(changed.values_list('pk', 'updated_at'))
+            if not changed:
+                return
+            ingredients = {recipe_id: [] for recipe_id, _ in changed}
+            for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+                    recipe_id__in=list(ingredients)).values_list(
+                    'recipe_id', 'ingredient_id'):
+                ingredients[recipe_id].append(ingredient_id)
+            for recipe_id, ingredient_ids in ingredients.items():
+                self.replace(recipe_id, ingredient_ids)
+            self.synced_at = changed[-1][1]
+
+    def ingredients_of(self, recipe_id):
+        if recipe_id in self.changed:
+            return self.changed[recipe_id]
+        if recipe_id + 1 >= len(self.base_starts):
+            return frozenset()
+        return frozenset(self.base_ingredients[
+            self.base_starts[recipe_id]:self.base_starts[recipe_id + 1]
+        ].tolist())
+
+    def replace(self, recipe_id, ingredient_ids):
+        """Set the ingredients of a recipe; the caller holds ``lock``."""
+        ingredient_ids = frozenset(ingredient_ids)
+        old_ingredient_ids = self.ingredients_of(recipe_id)
+        if recipe_id >= len(self.sizes):
+            sizes = np.zeros(
+                max(recipe_id + 1, len(self.sizes) * 5 // 4), dtype=np.uint8)
+            sizes[:len(self.sizes)] = self.sizes
+            self.sizes = sizes
+        for ingredient_id in old_ingredient_ids - ingredient_ids:
+            posting = self.postings[ingredient_id]
+            self.postings[ingredient_id] = np.delete(
+                posting, np.searchsorted(posting, recipe_id))
+        for ingredient_id in ingredient_ids - old_ingredient_ids:
+            posting = self.postings.get(
+                ingredient_id, np.empty(0, dtype=np.int32))
+            self.postings[ingredient_id] = np.insert(
+                posting, np.searchsorted(posting, recipe_id), recipe_id)
+        self.changed[recipe_id] = ingredient_ids
+        self.sizes[recipe_id] = min(len(ingredient_ids), 255)
+
+    def search(self, ingredient_ids, max_missing=None):
+        """Recipes using any of ``ingredient_ids`` as ``PantryResults``.
+
+        With ``max_missing`` only recipes missing at most that many
+        ingredients are kept; 0 keeps the recipes that can be cooked from
+        the pantry alone.
+        """
+        postings = [
+            self.postings[ingredient_id] for ingredient_id in
+            set(ingredient_ids) if ingredient_id in self.postings
+        ]
+        if not postings:
+            return PantryResults(
+                np.empty(0, dtype=np.int32), np.empty(0, dtype=np.uint16))
+        sizes = self.sizes
+        counts = np.bincount(
+            np.concatenate(postings), minlength=len(sizes))[:len(sizes)]
+        pairs = sizes.astype(np.uint16) << 8 | np.minimum(
+            counts, 255).astype(np.uint16)
+        ranks, missing = self.ranks
+        if max_missing is not None:
+            ranks = np.where(missing <= max_missing, ranks, NO_MATCH)
+        return PantryResults(ranks[pairs], pairs)
+
+
+class PantryResults:
+    """Pantry matches ordered by the covered fraction of ingredients, then
+    by fewer missing ingredients, then newest first.
+
+    Holds one sort key per recipe id; a slice only partitions out the
+    recipes up to its end, so the paginator never sorts every match.
+    Items are ``(recipe_id, covered, missing)`` tuples.
+    """
+
+    def __init__(self, ranks, pairs):
+        self.count = np.count_nonzero(ranks != NO_MATCH)
+        self.keys = (ranks.astype(np.int64) << 32) - np.arange(len(ranks))
+        self.pairs = pairs
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, items):
+        if not isinstance(items, slice):
+            raise TypeError('PantryResults only supports slicing')
+        stop = self.count if items.stop is None else min(
+            items.stop, self.count)
+        if stop <= 0:
+            return []
+        top = np.argpartition(self.keys, stop - 1)[:stop]
+        top = top[np.argsort(self.keys[top])][items]
+        pairs = self.pairs[top]
+        covered = pairs & 0xFF
+        return list(zip(
+            top.tolist(), covered.tolist(),
+            ((pairs >> 8) - covered).tolist()))
@@ -0,0 +1,192 @@
+"""Printable PDF shopping lists rendered outside the request workers.
+
+A PDF is named by its owner and a hash of the cart contents and stored in
+``SHOPPING_LIST_PDF_DIR``, shared by all workers, so an unchanged cart is
+served from the stored file and a user only ever reaches their own files.
+Missing files are rendered by a small process pool whose processes load
+the font and page layout once at start; the request only queues the job
+and the client polls until the file is there.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen.canvas import Canvas
+except ImportError:
+    Canvas = None
+
+logger = logging.getLogger(__name__)
+
+# Part of every file name; bump it when the layout changes.
+LAYOUT_VERSION = 1
+
+# Set in every pool process by ``load_layout``.
+layout = None
+
+
+class Layout:
+    """Font and page geometry shared by all renders of a pool process."""
+    margin = 56
+    title_size = 18
+    font_size = 11
+    line_height = 20
+    box_size = 9
+
+    def __init__(self, font_path):
+        self.width, self.height = A4
+        self.font = 'Helvetica'
+        # The built-in fonts have no Cyrillic glyphs.
+        if font_path and os.path.exists(font_path):
+            pdfmetrics.registerFont(TTFont('ShoppingList', font_path))
+            self.font = 'ShoppingList'
+
+    def draw(self, canvas, rows):
+        top = self.height - self.margin
+        canvas.setFont(self.font, self.title_size)
+        canvas.drawString(self.margin, top, 'Shopping list')
+        y = top - 2 * self.line_height
+        canvas.setFont(self.font, self.font_size)
+        for name, amount, measurement_unit in rows:
+            if y < self.margin:
+                canvas.showPage()
+                canvas.setFont(self.font, self.font_size)
+                y = top
+            canvas.rect(self.margin, y - 1, self.box_size, self.box_size)
+            canvas.drawString(
+                self.margin + 2 * self.box_size, y, f'{name}')
+            canvas.drawRightString(
+                self.width - self.margin, y, f'{amount} {measurement_unit}')
+            y -= self.line_height
+
+
+def load_layout(font_path):
+    global layout
+    layout = Layout(font_path)
+
+
+def prune(directory, max_age):
+    deadline = time.time() - max_age
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith('.pdf') and (
+                    entry.stat().st_mtime < deadline):
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+def render(path, rows, max_age):
+    """Write the shopping list of ``rows`` to ``path``; runs in the pool."""
+    directory = os.path.dirname(path)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            canvas = Canvas(file, pagesize=A4, pageCompression=1)
+            canvas.setTitle('Shopping list')
+            layout.draw(canvas, rows)
+            canvas.save()
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    prune(directory, max_age)
+
+
+class ShoppingListPDF:
+    """Stored PDF files and the pool rendering them, one per process."""
+    lock = threading.Lock()
+    pool = None
+
+    def __init__(self):
+        self.cache = caches[settings.RECIPES_CACHE_ALIAS]
+
+    @staticmethod
+    def available():
+        return Canvas is not None
+
+    @staticmethod
+    def key(user_id, rows):
+        source = '\n'.join(
+            f'{name}\t{amount}\t{measurement_unit}'
+            for name, amount, measurement_unit in rows)
+        return hashlib.sha256(
+            f'{LAYOUT_VERSION}\n{user_id}\n{source}'.encode()).hexdigest()
+
+    @staticmethod
+    def path(user_id, key):
+        return os.path.join(
+            settings.SHOPPING_LIST_PDF_DIR, f'{user_id}-{key}.pdf')
+
+    @staticmethod
+    def job_key(user_id, key):
+        return f'shopping-list-pdf:{user_id}:{key}'
+
+    @classmethod
+    def get_pool(cls, broken=None):
+        with cls.lock:
+            if cls.pool is None or cls.pool is broken:
+                # Spawned rather than forked: the request worker may hold
+                # threads and database connections.
+                cls.pool = ProcessPoolExecutor(
+                    max_workers=settings.SHOPPING_LIST_PDF_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=load_layout,
+                    initargs=(settings.SHOPPING_LIST_PDF_FONT,))
+            return cls.pool
+
+    def open(self, user_id, key):
+        """The stored file of ``key`` owned by ``user_id`` opened for
+        reading, or None."""
+        path = self.path(user_id, key)
+        try:
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        # Files that are still downloaded are not pruned.
+        os.utime(path)
+        return file
+
+    def is_pending(self, user_id, key):
+        return self.cache.get(self.job_key(user_id, key)) is not None
+
+    def render(self, user_id, key, rows):
+        """Queue the rendering of ``rows`` unless it is already queued."""
+        if not self.cache.add(self.job_key(user_id, key), 1,
+                              settings.SHOPPING_LIST_PDF_TIMEOUT):
+            return
+        os.makedirs(settings.SHOPPING_LIST_PDF_DIR, exist_ok=True)
+        job = (render, self.path(user_id, key), rows,
+               settings.SHOPPING_LIST_PDF_MAX_AGE)
+        pool = self.get_pool()
+        try:
+            future = pool.submit(*job)
+        except BrokenProcessPool:
+            future = self.get_pool(broken=pool).submit(*job)
+        future.add_done_callback(partial(self.finished, user_id, key))
+
+    def finished(self, user_id, key, future):
+        if future.exception() is not None:
+            logger.error('Failed to render shopping list %s of user %s',
+                         key, user_id, exc_info=future.exception())
+        try:
+            self.cache.delete(self.job_key(user_id, key))
+        finally:
+            # Runs in the pool's thread, whose connection the database
+            # cache would otherwise leave open.
+            connections.close_all()
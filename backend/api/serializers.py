@@ -1,18 +1,54 @@
+import hashlib
+from functools import partial
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers, status
 from rest_framework.exceptions import ValidationError
 from rest_framework.fields import ReadOnlyField
+from rest_framework.permissions import SAFE_METHODS
 
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingList, Tag)
+from recipes.models import (CatalogVersion, Favorite, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCartItem, ShoppingList,
+                            Tag)
 from users.models import Follow
 
+from .pantry import PantryIndex
+from .snapshots import SnapshotRelatedField
+from .utils import get_requested_fields, get_subscriptions
+
 User = get_user_model()
 
 
+class SparseFieldsMixin:
+    """Render only the fields selected with ?fields= and ?omit=.
+
+    Applies to the top-level serializer of a read request; nested
+    serializers keep all of their fields.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return fields
+        parent = self.parent
+        if parent is not None and not (
+                isinstance(parent, serializers.ListSerializer)
+                and parent.parent is None):
+            return fields
+        selected = get_requested_fields(request, fields)
+        return {
+            name: field for name, field in fields.items()
+            if name in selected
+        }
+
+
 class CustomUserCreateSerializer(UserCreateSerializer):
     class Meta:
         model = User
@@ -26,7 +62,7 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         )
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(SparseFieldsMixin, UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -41,13 +77,10 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return Follow.objects.filter(user=user, author=obj.id).exists()
+        return obj.id in get_subscriptions(self.context['request'])
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = '__all__'
@@ -64,6 +97,19 @@ class TagsSerializer(serializers.ModelSerializer):
         )
 
 
+class SubscribeListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        follows = list(data)
+        self.child.context['latest_recipes'] = (
+            self.child.load_latest_recipes(
+                [follow.author_id for follow in follows],
+                self.child.get_recipes_limit()
+            )
+        )
+        return super().to_representation(follows)
+
+
 class SubscribeSerializer(CustomUserSerializer):
     id = serializers.ReadOnlyField(source='author.id')
     first_name = serializers.ReadOnlyField(source='author.first_name')
@@ -76,6 +122,7 @@ class SubscribeSerializer(CustomUserSerializer):
             'recipes_count', 'recipes'
         )
         read_only_fields = ('email', 'username')
+        list_serializer_class = SubscribeListSerializer
 
     def validate(self, data):
         author = self.instance
@@ -92,21 +139,52 @@ class SubscribeSerializer(CustomUserSerializer):
             )
         return data
 
-    def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj.author)
+    def get_recipes_limit(self):
+        limit = self.context.get('request').GET.get('recipes_limit')
         if limit:
-            queryset = queryset[:int(limit)]
-        return RecipeSerializer(queryset, many=True).data
+            return int(limit)
+        return None
+
+    @staticmethod
+    def load_latest_recipes(author_ids, limit=None):
+        """Fetch the latest recipes of every author in one query.
+
+        Returns a mapping of author id to at most ``limit`` recipes.
+        """
+        windowed = Recipe.objects.filter(
+            author_id__in=author_ids
+        ).annotate(
+            author_rank=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=[F('pub_date').desc(), F('id').desc()]),
+        ).order_by().values(
+            'id', 'author_id', 'name', 'image', 'cooking_time', 'author_rank')
+        sql, params = windowed.query.sql_with_params()
+        sql = f'SELECT * FROM ({sql}) latest'
+        if limit is not None:
+            sql += ' WHERE latest.author_rank <= %s'
+            params += (limit,)
+        sql += ' ORDER BY latest.author_id, latest.author_rank'
+
+        latest_recipes = {}
+        for recipe in Recipe.objects.raw(sql, params):
+            latest_recipes.setdefault(recipe.author_id, []).append(recipe)
+        return latest_recipes
+
+    def get_recipes(self, obj):
+        latest_recipes = self.context.get('latest_recipes')
+        if latest_recipes is None:
+            latest_recipes = self.load_latest_recipes(
+                [obj.author_id], self.get_recipes_limit())
+        recipes = latest_recipes.get(obj.author_id, [])
+        return RecipeSerializer(recipes, many=True).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+        return obj.author.recipes_count
 
     def get_is_subscribed(self, obj):
-        return Follow.objects.filter(
-            user=self.context.get('request').user, author=obj.author
-        ).exists()
+        return obj.user_id == self.context.get('request').user.id
 
 
 class RecipeSerializer(serializers.ModelSerializer):
@@ -128,7 +206,7 @@ class RecipeIngredientReadSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     tags = TagsSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField(read_only=True)
@@ -139,16 +217,19 @@ class RecipeReadSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        fields = '__all__'
+        exclude = (
+            'updated_at', 'favorites_count', 'trending_score',
+            'in_timelines')
 
     def get_ingredients(self, obj):
-        ingredients = RecipeIngredient.objects.filter(recipe=obj)
+        ingredients = obj.recipe_ingredients.all()
         serializer = RecipeIngredientReadSerializer(ingredients, many=True)
         return serializer.data
 
 
 class RecipeIngredientWriteSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = SnapshotRelatedField(
+        CatalogVersion.INGREDIENTS, queryset=Ingredient.objects.all())
     amount = serializers.IntegerField()
 
     class Meta:
@@ -157,8 +238,8 @@ class RecipeIngredientWriteSerializer(serializers.ModelSerializer):
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True)
+    tags = SnapshotRelatedField(
+        CatalogVersion.TAGS, queryset=Tag.objects.all(), many=True)
     ingredients = RecipeIngredientWriteSerializer(many=True)
     author = CustomUserSerializer(read_only=True)
     image = Base64ImageField()
@@ -170,7 +251,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             'name', 'text', 'cooking_time')
 
     def validate(self, data):
-        ingredients = data['ingredients']
+        ingredients = data.get('ingredients', [])
         ingredients_list = []
         for ingredient in ingredients:
             ingredient_id = ingredient['id']
@@ -218,6 +299,12 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                 amount=ingredient.get('amount'),
             ) for ingredient in ingredients])
 
+    @staticmethod
+    def update_pantry_index(recipe, ingredients):
+        transaction.on_commit(partial(
+            PantryIndex.update_recipe, recipe.pk,
+            [ingredient['id'].pk for ingredient in ingredients]))
+
     @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
@@ -226,6 +313,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(author=author, **validated_data)
         recipe.tags.set(tags)
         self.create_ingredients_amounts(recipe=recipe, ingredients=ingredients)
+        self.update_pantry_index(recipe, ingredients)
         return recipe
 
     def to_representation(self, instance):
@@ -233,18 +321,122 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         context = {'request': request}
         return RecipeReadSerializer(instance, context=context).data
 
+    @staticmethod
+    def same_image(stored, image):
+        """Whether the uploaded ``image`` has the content of the stored
+        one, so that an unchanged image is not written again."""
+        if not stored:
+            return False
+        digests = []
+        try:
+            with stored.storage.open(stored.name, 'rb') as file:
+                for source in (file, image):
+                    digest = hashlib.sha256()
+                    for chunk in source.chunks():
+                        digest.update(chunk)
+                    digests.append(digest.digest())
+        except FileNotFoundError:
+            return False
+        return digests[0] == digests[1]
+
+    @staticmethod
+    def update_tags(recipe, tags):
+        # The through table is written directly: m2m signals would touch
+        # the recipe on every remove and add, and ``update`` saves it once.
+        through = Recipe.tags.through
+        current = set(through.objects.filter(
+            recipe=recipe).values_list('tag_id', flat=True))
+        tag_ids = {tag.pk for tag in tags}
+        if tag_ids == current:
+            return False
+        if current - tag_ids:
+            through.objects.filter(
+                recipe=recipe, tag_id__in=current - tag_ids).delete()
+        through.objects.bulk_create([
+            through(recipe=recipe, tag_id=pk) for pk in tag_ids - current
+        ])
+        return True
+
+    def update_ingredients(self, recipe, ingredients):
+        amounts = {
+            ingredient['id'].pk: ingredient['amount']
+            for ingredient in ingredients
+        }
+        current, stale = {}, []
+        for row in RecipeIngredient.objects.filter(recipe=recipe):
+            if row.ingredient_id in current:
+                stale.append(row)
+            else:
+                current[row.ingredient_id] = row
+        delta = dict(amounts)
+        for row in [*current.values(), *stale]:
+            delta[row.ingredient_id] = (
+                delta.get(row.ingredient_id, 0) - row.amount)
+        if not any(delta.values()) and not stale:
+            return False
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=pk, amount=amount)
+            for pk, amount in amounts.items() if pk not in current
+        ])
+        changed = []
+        for pk, row in current.items():
+            if pk in amounts and row.amount != amounts[pk]:
+                row.amount = amounts[pk]
+                changed.append(row)
+            elif pk not in amounts:
+                stale.append(row)
+        RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        if stale:
+            RecipeIngredient.objects.filter(
+                pk__in=[row.pk for row in stale]).delete()
+        ShoppingCartItem.update_recipe(recipe.pk, delta)
+        if amounts.keys() != current.keys():
+            self.update_pantry_index(recipe, ingredients)
+        return True
+
     @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        instance.tags.clear()
-        instance.tags.set(tags)
-
-        ingredients = validated_data.pop('ingredients')
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        self.create_ingredients_amounts(
-            recipe=instance,
-            ingredients=ingredients)
-        return super().update(instance, validated_data)
+        # Only what differs from the stored recipe is written, and nested
+        # collections left out of a PATCH are not touched at all.
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        if 'image' in validated_data and self.same_image(
+                instance.image, validated_data['image']):
+            del validated_data['image']
+        update_fields = []
+        for field, value in validated_data.items():
+            if getattr(instance, field) != value:
+                setattr(instance, field, value)
+                update_fields.append(field)
+        related_changed = False
+        if tags is not None:
+            related_changed |= self.update_tags(instance, tags)
+        if ingredients is not None:
+            related_changed |= self.update_ingredients(instance, ingredients)
+        if update_fields or related_changed:
+            # Also sends the signals refreshing caches and indexes, which
+            # bulk writes of tags and ingredients do not.
+            instance.save(update_fields=[*update_fields, 'updated_at'])
+        return instance
+
+
+class PantrySearchSerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.PANTRY_MAX_INGREDIENTS)
+    missing = serializers.IntegerField(min_value=0, required=False)
+
+    def to_internal_value(self, data):
+        # Ingredient ids come as ?ingredients=1,2 or ?ingredients=1&...=2.
+        values = {'ingredients': [
+            value for values in data.getlist('ingredients')
+            for value in values.split(',') if value
+        ]}
+        if 'missing' in data:
+            values['missing'] = data['missing']
+        return super().to_internal_value(values)
 
 
 class ShoppingListSerializer(serializers.ModelSerializer):
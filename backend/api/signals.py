@@ -0,0 +1,74 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Favorite, Recipe, ShoppingList, Tag
+from recipes.signals import recipes_changed
+from users.models import Follow
+
+from .cache import MembershipCache, ResponseCache, TagMap
+from .events import hub
+from .pantry import PantryIndex
+
+
+@receiver(recipes_changed)
+def invalidate_recipe_responses(recipe_ids, **kwargs):
+    transaction.on_commit(partial(ResponseCache().invalidate, recipe_ids))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_map(**kwargs):
+    transaction.on_commit(TagMap().invalidate)
+
+
+def publish_updates(recipe_ids):
+    recipes = Recipe.objects.filter(pk__in=recipe_ids).values_list(
+        'pk', 'author_id')
+    for recipe_id, author_id in recipes:
+        hub.publish('updated', recipe_id, author_id)
+
+
+@receiver(recipes_changed)
+def recipes_updated(recipe_ids, created=False, **kwargs):
+    if not created:
+        transaction.on_commit(partial(publish_updates, recipe_ids))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(
+            hub.publish, 'created', instance.pk, instance.author_id))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    transaction.on_commit(partial(
+        hub.publish, 'deleted', instance.pk, instance.author_id))
+    transaction.on_commit(partial(PantryIndex.update_recipe, instance.pk, []))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_save, sender=Follow)
+def membership_added(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(
+            MembershipCache().invalidate, sender, instance.user_id))
+        if sender is Follow:
+            transaction.on_commit(partial(
+                hub.follow_changed, instance.user_id, instance.author_id,
+                True))
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingList)
+@receiver(post_delete, sender=Follow)
+def membership_removed(sender, instance, **kwargs):
+    transaction.on_commit(partial(
+        MembershipCache().invalidate, sender, instance.user_id))
+    if sender is Follow:
+        transaction.on_commit(partial(
+            hub.follow_changed, instance.user_id, instance.author_id, False))
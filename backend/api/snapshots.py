@@ -0,0 +1,183 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from rest_framework import serializers
+
+from recipes.models import CatalogVersion, Ingredient, Tag
+
+from .renderers import ORJSONRenderer
+
+
+class ReferenceSnapshot:
+    """Pre-serialized catalog in a memory-mapped file shared by workers.
+
+    The file holds the JSON list response of the catalog and an index of
+    the byte range of every row sorted by id. It is written once per
+    catalog version and atomically renamed into place; every process maps
+    the same file, so the pages are shared instead of copied per worker.
+    A new ``CatalogVersion`` makes the next request map the new file.
+    """
+    catalogs = {
+        CatalogVersion.TAGS: (Tag, ('id', 'name', 'color', 'slug')),
+        CatalogVersion.INGREDIENTS: (
+            Ingredient, ('id', 'name', 'measurement_unit')),
+    }
+    header = struct.Struct('<8sQ')
+    magic = b'FGSNAP01'
+    lock = threading.Lock()
+    loaded = {}
+
+    def __init__(self, catalog, version, path):
+        self.model, self.fields = self.catalogs[catalog]
+        self.version = version
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.map)
+        magic, count = self.header.unpack_from(view)
+        if magic != self.magic:
+            raise ValueError(f'{path} is not a reference snapshot')
+        offset = self.header.size
+        self.ids, self.starts, self.ends = (
+            view[offset + 8 * count * part:offset + 8 * count * (part + 1)]
+            .cast('q') for part in range(3))
+        self.body = view[offset + 24 * count:]
+
+    @staticmethod
+    def revision(catalog):
+        """File revision of a ``CatalogVersion``: its version and a digest
+        of the database and of the version's update time, so that another
+        database whose catalog reached the same version never shares it."""
+        database = connection.settings_dict
+        source = '|'.join(str(part) for part in (
+            connection.vendor, database['HOST'], database['PORT'],
+            database['NAME'],
+            catalog.updated_at and catalog.updated_at.isoformat(),
+        ))
+        digest = hashlib.md5(source.encode()).hexdigest()[:16]
+        return f'{catalog.version}-{digest}'
+
+    @classmethod
+    def path(cls, catalog, revision):
+        return os.path.join(
+            settings.REFERENCE_SNAPSHOT_DIR, f'{catalog}-{revision}.snap')
+
+    @classmethod
+    def get(cls, catalog):
+        """Snapshot of ``catalog``, a ``CatalogVersion``."""
+        name, version = catalog.name, cls.revision(catalog)
+        snapshot = cls.loaded.get(name)
+        if snapshot is None or snapshot.version != version:
+            with cls.lock:
+                snapshot = cls.loaded.get(name)
+                if snapshot is None or snapshot.version != version:
+                    path = cls.path(name, version)
+                    if not os.path.exists(path):
+                        cls.build(name, path)
+                    snapshot = cls(name, version, path)
+                    # Files that are still mapped are not pruned.
+                    os.utime(path)
+                    cls.loaded[name] = snapshot
+        return snapshot
+
+    @classmethod
+    def for_request(cls, request, catalog):
+        """Snapshot of the current catalog version, memoized on request."""
+        snapshots = request.__dict__.setdefault('_reference_snapshots', {})
+        if catalog not in snapshots:
+            snapshots[catalog] = cls.get(CatalogVersion.get(catalog))
+        return snapshots[catalog]
+
+    @classmethod
+    def build(cls, catalog, path):
+        model, fields = cls.catalogs[catalog]
+        render = ORJSONRenderer().render
+        rows = [
+            (row['id'], render(row))
+            for row in model.objects.values(*fields)
+        ]
+        body = bytearray(b'[')
+        index = []
+        for position, (pk, data) in enumerate(rows):
+            if position:
+                body += b','
+            index.append((pk, len(body), len(body) + len(data)))
+            body += data
+        body += b']'
+        index.sort()
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+                dir=directory, suffix='.tmp', delete=False) as file:
+            file.write(cls.header.pack(cls.magic, len(index)))
+            for part in range(3):
+                file.write(struct.pack(
+                    f'<{len(index)}q', *(entry[part] for entry in index)))
+            file.write(body)
+        os.replace(file.name, path)
+        cls.prune(directory, path)
+
+    @staticmethod
+    def prune(directory, current):
+        """Remove snapshots no process has mapped for
+        ``REFERENCE_SNAPSHOT_MAX_AGE``; ``current`` is always kept.
+
+        Other revisions are not removed as soon as they are replaced, since
+        workers of another database may still use them. A process that
+        mapped a removed file keeps reading it.
+        """
+        deadline = time.time() - settings.REFERENCE_SNAPSHOT_MAX_AGE
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.path == current or not entry.name.endswith(
+                        '.snap') or entry.stat().st_mtime >= deadline:
+                    continue
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def row(self, pk):
+        """JSON bytes of the row with primary key ``pk`` or None."""
+        position = bisect_left(self.ids, pk)
+        if position == len(self.ids) or self.ids[position] != pk:
+            return None
+        return bytes(self.body[self.starts[position]:self.ends[position]])
+
+    def instance(self, pk):
+        data = self.row(pk)
+        if data is None:
+            return None
+        row = json.loads(data)
+        return self.model.from_db(
+            self.model.objects.db, list(row), list(row.values()))
+
+
+class SnapshotRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key field resolved from the ``catalog`` reference snapshot."""
+
+    def __init__(self, catalog, **kwargs):
+        self.catalog = catalog
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        snapshot = ReferenceSnapshot.for_request(
+            self.context['request'], self.catalog)
+        instance = snapshot.instance(pk)
+        if instance is None:
+            self.fail('does_not_exist', pk_value=data)
+        return instance
@@ -1,8 +1,118 @@
-def shopping_cart_list_creation(ingredients):
-    shopping_list = '\n'.join([
-        f'{ingredient["ingredient__name"]} - {ingredient["amount"]} '
-        f'{ingredient["ingredient__measurement_unit"]}'
-        for ingredient in ingredients
-    ])
-    filename = 'shopping_list.txt'
-    return filename, shopping_list
+import csv
+import io
+
+from recipes.models import Favorite, ShoppingList
+from users.models import Follow
+
+from .cache import MembershipCache
+from .renderers import ORJSONRenderer
+
+# Aggregated ingredient rows rendered into one streamed chunk.
+SHOPPING_LIST_CHUNK_ROWS = 500
+
+
+def chunked(rows, size=SHOPPING_LIST_CHUNK_ROWS):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def shopping_list_txt(ingredients):
+    separator = ''
+    for chunk in chunked(ingredients):
+        lines = []
+        for ingredient in chunk:
+            lines.append(
+                f'{separator}{ingredient["ingredient__name"]} - '
+                f'{ingredient["amount"]} '
+                f'{ingredient["ingredient__measurement_unit"]}')
+            separator = '\n'
+        yield ''.join(lines).encode()
+
+
+def shopping_list_csv(ingredients):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('name', 'amount', 'measurement_unit'))
+    for chunk in chunked(ingredients):
+        writer.writerows(
+            (ingredient['ingredient__name'], ingredient['amount'],
+             ingredient['ingredient__measurement_unit'])
+            for ingredient in chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def shopping_list_json(ingredients):
+    render = ORJSONRenderer().render
+    opening = b'['
+    for chunk in chunked(ingredients):
+        yield opening + b','.join(render({
+            'name': ingredient['ingredient__name'],
+            'amount': ingredient['amount'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+        }) for ingredient in chunk)
+        opening = b','
+    yield b'[]' if opening == b'[' else b']'
+
+
+# file_format: (content type, chunk generator)
+SHOPPING_LIST_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', shopping_list_txt),
+    'csv': ('text/csv; charset=utf-8', shopping_list_csv),
+    'json': ('application/json', shopping_list_json),
+}
+
+
+def get_subscriptions(request):
+    """Return ids of the authors the current user follows.
+
+    The set is read from ``MembershipCache`` once and kept on the request,
+    so every serializer rendering users during the request shares it.
+    """
+    subscriptions = getattr(request, '_subscriptions', None)
+    if subscriptions is None:
+        subscriptions = set()
+        if request.user.is_authenticated:
+            subscriptions = MembershipCache().get(Follow, request.user.id)
+        request._subscriptions = subscriptions
+    return subscriptions
+
+
+def get_recipe_memberships(request):
+    """Return ids of the recipes in the current user's favorites and cart.
+
+    Read from ``MembershipCache`` once per request.
+    """
+    memberships = getattr(request, '_recipe_memberships', None)
+    if memberships is None:
+        memberships = set(), set()
+        if request.user.is_authenticated:
+            cache = MembershipCache()
+            memberships = (cache.get(Favorite, request.user.id),
+                           cache.get(ShoppingList, request.user.id))
+        request._recipe_memberships = memberships
+    return memberships
+
+
+def get_requested_fields(request, available):
+    """Return the names from ``available`` selected by ?fields= and ?omit=.
+
+    ``id`` is always kept.
+    """
+    selected = set(available)
+    fields = request.query_params.get('fields')
+    if fields:
+        selected &= set(fields.split(','))
+    omit = request.query_params.get('omit')
+    if omit:
+        selected -= set(omit.split(','))
+    return selected | ({'id'} & set(available))
@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Exists, OuterRef, Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Count, F, Max, Prefetch
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
@@ -9,25 +12,49 @@ from rest_framework.decorators import action
 from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 from rest_framework.response import Response
 
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+from recipes.models import (CatalogVersion, Favorite, Ingredient, Recipe,
+                            RecipeIngredient, Recommendation, ShoppingCartItem,
                             ShoppingList, Tag)
+from recipes.similarity import similar_recipes
 from users.models import Follow
 
+from .autocomplete import IngredientAutocomplete
+from .cache import ShoppingListCache
+from .fast_serializers import RecipeFastReadSerializer
 from .filters import IngredientSearchFilter, RecipeFilter
+from .mixins import (CatalogConditionalGetMixin, ConditionalGetMixin,
+                     CursorPaginationMixin, ReferenceSnapshotMixin,
+                     SharedCacheMixin)
+from .pagination import (FeedPagination, RecipeKeysetPagination,
+                         SubscriptionKeysetPagination)
+from .pantry import PantryIndex
+from .pdf import ShoppingListPDF
 from .permissions import IsAdminOrReadOnly, IsAdminUserOrReadOnly
 from .serializers import (CustomUserSerializer, IngredientSerializer,
-                          RecipeReadSerializer, RecipeSerializer,
-                          RecipeWriteSerializer, SubscribeSerializer,
-                          TagsSerializer)
-from .utils import shopping_cart_list_creation
+                          PantrySearchSerializer, RecipeReadSerializer,
+                          RecipeSerializer, RecipeWriteSerializer,
+                          SubscribeSerializer, TagsSerializer)
+from .utils import (SHOPPING_LIST_FORMATS, get_recipe_memberships,
+                    get_requested_fields, get_subscriptions)
 
 User = get_user_model()
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(CursorPaginationMixin, UserViewSet):
     serializer_class = CustomUserSerializer
     permission_classes = [IsAuthenticated, ]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        fields = get_requested_fields(
+            self.request, CustomUserSerializer.Meta.fields)
+        return queryset.only('id', *(
+            name for name in ('email', 'username', 'first_name', 'last_name')
+            if name in fields
+        ))
+
     @action(
         methods=['get'],
         detail=False)
@@ -49,6 +76,7 @@ class CustomUserViewSet(UserViewSet):
     @action(
         methods=['post', 'delete'],
         detail=True)
+    @transaction.atomic
     def subscribe(self, request, id=None):
         user = request.user
         author = get_object_or_404(User, id=id)
@@ -67,10 +95,12 @@ class CustomUserViewSet(UserViewSet):
         self.perform_destroy(follow)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    @action(detail=False)
+    @action(
+        detail=False,
+        cursor_pagination_class=SubscriptionKeysetPagination)
     def subscriptions(self, request):
         user = request.user
-        queryset = Follow.objects.filter(user=user)
+        queryset = Follow.objects.filter(user=user).select_related('author')
         pages = self.paginate_queryset(queryset)
         serializer = SubscribeSerializer(
             pages,
@@ -79,32 +109,205 @@ class CustomUserViewSet(UserViewSet):
         return self.get_paginated_response(serializer.data)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, SharedCacheMixin,
+                    CursorPaginationMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
+    cursor_pagination_class = RecipeKeysetPagination
     permission_classes = [IsAdminUserOrReadOnly, ]
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    private_params = ('is_favorited', 'is_in_shopping_cart')
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    def get_requested_fields(self):
+        if self.request.method not in SAFE_METHODS:
+            return set(RecipeFastReadSerializer.output_fields)
+        return get_requested_fields(
+            self.request, RecipeFastReadSerializer.output_fields)
+
     def get_queryset(self):
-        user = self.request.user
-        queryset = Recipe.objects.select_related(
-            'author').prefetch_related('tags', 'ingredients')
-
-        if user.is_authenticated:
-            return queryset.annotate(
-                is_favorited=Exists(Favorite.objects.filter(
-                    user=user, recipe__pk=OuterRef('pk'))
-                ),
-                is_in_shopping_cart=Exists(ShoppingList.objects.filter(
-                    user=user, recipe__pk=OuterRef('pk'))
-                )
-            )
-        return queryset
+        fields = self.get_requested_fields()
+        # pub_date is the pagination key and is always loaded.
+        queryset = Recipe.objects.defer(*(
+            name for name in RecipeFastReadSerializer.column_fields
+            if name not in fields and name != 'pub_date'
+        ))
+        if 'author' in fields:
+            queryset = queryset.select_related('author')
+        if 'tags' in fields:
+            queryset = queryset.prefetch_related('tags')
+        if 'ingredients' not in fields:
+            return queryset
+        return queryset.prefetch_related(Prefetch(
+            'recipe_ingredients',
+            queryset=RecipeIngredient.objects.select_related(
+                'ingredient').order_by('id')
+        ))
+
+    def personalize(self, request, data):
+        favorites, shopping_cart = get_recipe_memberships(request)
+        subscriptions = get_subscriptions(request)
+        if self.detail:
+            recipes = [data]
+        elif isinstance(data, dict):
+            recipes = data['results']
+        else:
+            recipes = data
+        for recipe in recipes:
+            if 'is_favorited' in recipe:
+                recipe['is_favorited'] = recipe['id'] in favorites
+            if 'is_in_shopping_cart' in recipe:
+                recipe['is_in_shopping_cart'] = recipe['id'] in shopping_cart
+            if 'author' in recipe:
+                author = recipe['author']
+                author['is_subscribed'] = author['id'] in subscriptions
+        return data
+
+    def get_validators(self):
+        if self.action == 'download_shopping_cart':
+            return self.shopping_cart_validators(), None
+        pk = self.kwargs.get('pk', '')
+        if self.action != 'retrieve' or not pk.isdigit():
+            return None, None
+        validators = Recipe.objects.filter(pk=pk).values_list(
+            'updated_at', 'author_id').first()
+        if validators is None:
+            return None, None
+        updated_at, author_id = validators
+        if self.request.user.is_anonymous:
+            return (updated_at.isoformat(),), updated_at
+        favorites, shopping_cart = get_recipe_memberships(self.request)
+        # Last-Modified does not cover the viewer's own flags, so it is
+        # only sent to anonymous clients.
+        return (
+            updated_at.isoformat(),
+            int(pk) in favorites,
+            int(pk) in shopping_cart,
+            author_id in get_subscriptions(self.request),
+        ), None
+
+    def shopping_cart_validators(self):
+        cart = ShoppingList.objects.filter(
+            user=self.request.user).aggregate(
+            recipes=Count('id'), added_at=Max('added_at'),
+            updated_at=Max('recipe__updated_at'))
+        ingredients = CatalogVersion.get(CatalogVersion.INGREDIENTS)
+        return (
+            self.request.user.pk,
+            cart['recipes'],
+            cart['added_at'] and cart['added_at'].isoformat(),
+            cart['updated_at'] and cart['updated_at'].isoformat(),
+            ingredients.version,
+        )
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_RECIPE_SERIALIZER:
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(self.fast_list, request, *args, **kwargs)
+
+    def fast_list(self, request, *args, **kwargs):
+        serializer = RecipeFastReadSerializer(
+            request, self.get_requested_fields())
+        rows = serializer.rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        return Response(serializer.serialize(list(rows)))
+
+    def update(self, request, *args, **kwargs):
+        # The written recipe is rendered without the viewer's memberships,
+        # like every other response before ``personalize``.
+        response = super().update(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            self.personalize(request, response.data)
+        return response
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        pagination_class=FeedPagination,
+        cursor_pagination_class=None)
+    def feed(self, request):
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = RecipeReadSerializer(
+            page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(
+            self.personalize(request, serializer.data))
+
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def recommended(self, request):
+        """Recipes recommended by ``build_recommendations`` from the
+        viewer's favorites and cart, or popular recipes until then."""
+        queryset = self.get_queryset()
+        if Recommendation.objects.filter(user=request.user).exists():
+            queryset = queryset.filter(
+                recommendations__user=request.user
+            ).annotate(
+                score=F('recommendations__score')
+            ).order_by('-score', '-id')
+        else:
+            queryset = queryset.order_by(*RecipeFilter.ORDERINGS['popular'])
+        page = self.paginate_queryset(queryset)
+        serializer = RecipeReadSerializer(
+            page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(
+            self.personalize(request, serializer.data))
+
+    @action(detail=False, cursor_pagination_class=None)
+    def pantry(self, request):
+        """Recipes that can be cooked from ``?ingredients=``.
+
+        Recipes using any of the ingredients are ranked by the share of
+        their ingredients covered; ``?missing=k`` keeps only those missing
+        at most k ingredients, ``?missing=0`` those fully covered.
+        """
+        params = PantrySearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        matches = PantryIndex.get().search(
+            params.validated_data['ingredients'],
+            params.validated_data.get('missing'))
+        page = self.paginate_queryset(matches)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page])
+        page = [match for match in page if match[0] in recipes]
+        data = RecipeReadSerializer(
+            [recipes[recipe_id] for recipe_id, _, _ in page], many=True,
+            context=self.get_serializer_context()).data
+        for recipe, (_, covered, missing) in zip(data, page):
+            recipe['covered_ingredients'] = covered
+            recipe['missing_ingredients'] = missing
+        return self.get_paginated_response(self.personalize(request, data))
+
+    @action(detail=True)
+    def similar(self, request, pk):
+        """Recipes with the most similar ingredients.
+
+        ``?rerank=tags`` also rewards shared tags; ``?limit=`` sets the
+        number of recipes.
+        """
+        recipe = get_object_or_404(Recipe.objects.only('id'), pk=pk)
+        limit = request.query_params.get('limit', '')
+        limit = min(
+            int(limit) if limit.isdigit() and int(limit) > 0
+            else settings.SIMILAR_RECIPES_LIMIT,
+            settings.SIMILAR_RECIPES_MAX_LIMIT)
+        tag_weight = (
+            settings.SIMILAR_TAG_WEIGHT
+            if request.query_params.get('rerank') == 'tags' else 0)
+        similar = similar_recipes(recipe.pk, limit, tag_weight)
+        recipes = Recipe.objects.only(*RecipeSerializer.Meta.fields).in_bulk(
+            [recipe_id for recipe_id, _ in similar])
+        data = []
+        for recipe_id, score in similar:
+            if recipe_id in recipes:
+                item = RecipeSerializer(recipes[recipe_id]).data
+                item['similarity'] = round(score, 3)
+                data.append(item)
+        return Response(data)
 
     @action(
         detail=True,
@@ -126,6 +329,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return self.add_to(ShoppingList, request.user, pk)
         return self.delete_from(ShoppingList, request.user, pk)
 
+    @transaction.atomic
     def add_to(self, model, user, pk):
         if model.objects.filter(user=user, recipe__id=pk).exists():
             return Response({
@@ -150,23 +354,102 @@ class RecipeViewSet(viewsets.ModelViewSet):
         methods=['get'],
         permission_classes=[IsAuthenticated])
     def download_shopping_cart(self, request):
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_list__user=request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
+        file_format = request.query_params.get('file_format', 'txt')
+        pdf = ShoppingListPDF()
+        if file_format == 'pdf' and pdf.available():
+            return self.download_shopping_cart_pdf(request, pdf)
+        if file_format not in SHOPPING_LIST_FORMATS:
+            formats = [*SHOPPING_LIST_FORMATS]
+            if pdf.available():
+                formats.append('pdf')
+            return Response({
+                'file_format': 'Unsupported format, choose one of: '
+                               + ', '.join(formats)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        content_type, render = SHOPPING_LIST_FORMATS[file_format]
+        parts, _ = self.get_validators()
+        etag = self.make_etag(parts)
+        if self.is_not_modified(etag, None):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+        cache = ShoppingListCache()
+        content = cache.get(request.user.pk, etag)
+        if content is not None:
+            response = HttpResponse(content, content_type=content_type)
+            response['Content-Length'] = len(content)
+        else:
+            # Rows are read from a server-side cursor and rendered as they
+            # are sent, so the file is never held in memory as a whole.
+            ingredients = ShoppingCartItem.objects.filter(
+                user=request.user
+            ).values(
+                'ingredient__name',
+                'ingredient__measurement_unit',
+                'amount'
+            ).order_by(
+                'ingredient__name', 'ingredient__measurement_unit'
+            ).iterator(chunk_size=2000)
+            response = StreamingHttpResponse(
+                cache.tee(request.user.pk, etag, render(ingredients)),
+                content_type=content_type)
+        response['ETag'] = etag
+        response['Content-Disposition'] = (
+            f'attachment; filename=shopping_list.{file_format}')
+        return response
 
-        filename, shopping_list = shopping_cart_list_creation(ingredients)
+    def download_shopping_cart_pdf(self, request, pdf):
+        rows = list(ShoppingCartItem.objects.filter(
+            user=request.user
+        ).order_by(
+            'ingredient__name', 'ingredient__measurement_unit'
+        ).values_list(
+            'ingredient__name', 'amount', 'ingredient__measurement_unit'))
+        key = pdf.key(request.user.pk, rows)
+        file = pdf.open(request.user.pk, key)
+        if file is not None:
+            return self.pdf_response(file)
+        pdf.render(request.user.pk, key, rows)
+        return self.pdf_pending_response(request, key)
 
-        response = HttpResponse(shopping_list,
-                                content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename={filename}'
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated],
+        url_path=r'download_shopping_cart/pdf/(?P<key>[0-9a-f]{64})',
+        url_name='shopping-cart-pdf')
+    def shopping_cart_pdf(self, request, key):
+        # Files are looked up under the requesting user only, so the key of
+        # someone else's list finds nothing.
+        pdf = ShoppingListPDF()
+        file = pdf.open(request.user.pk, key)
+        if file is not None:
+            return self.pdf_response(file)
+        if pdf.is_pending(request.user.pk, key):
+            return self.pdf_pending_response(request, key)
+        return Response({
+            'errors': 'Shopping list not found, download it again'
+        }, status=status.HTTP_404_NOT_FOUND)
 
-        return response
+    @staticmethod
+    def pdf_response(file):
+        return FileResponse(
+            file, as_attachment=True, filename='shopping_list.pdf',
+            content_type='application/pdf')
 
+    @staticmethod
+    def pdf_pending_response(request, key):
+        url = request.build_absolute_uri(
+            reverse('api:recipe-shopping-cart-pdf', args=[key]))
+        return Response(
+            {'status': 'pending', 'url': url},
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': url, 'Retry-After': '1'})
 
-class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
+
+class IngredientsViewSet(CatalogConditionalGetMixin, ReferenceSnapshotMixin,
+                         viewsets.ReadOnlyModelViewSet):
+    catalog = CatalogVersion.INGREDIENTS
     queryset = Ingredient.objects.all()
     permission_classes = (IsAdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
@@ -174,8 +457,31 @@ class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientSearchFilter
     pagination_class = None
 
+    def get_queryset(self):
+        fields = get_requested_fields(
+            self.request, ('id', 'name', 'measurement_unit'))
+        return super().get_queryset().only('id', *(
+            name for name in ('name', 'measurement_unit') if name in fields
+        ))
+
+    @action(detail=False)
+    def autocomplete(self, request):
+        return self.conditional(self.suggest, request)
+
+    def suggest(self, request):
+        limit = request.query_params.get('limit', '')
+        limit = min(
+            int(limit) if limit.isdigit() and int(limit) > 0
+            else settings.INGREDIENT_AUTOCOMPLETE_LIMIT,
+            settings.INGREDIENT_AUTOCOMPLETE_MAX_LIMIT)
+        index = IngredientAutocomplete.get(self.get_catalog().version)
+        return Response(
+            index.search(request.query_params.get('name', ''), limit))
+
 
-class TagsViewSet(viewsets.ReadOnlyModelViewSet):
+class TagsViewSet(CatalogConditionalGetMixin, ReferenceSnapshotMixin,
+                  viewsets.ReadOnlyModelViewSet):
+    catalog = CatalogVersion.TAGS
     queryset = Tag.objects.all()
     pagination_class = None
     serializer_class = TagsSerializer
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 import os
+import tempfile
 from datetime import timedelta
 
 from dotenv import load_dotenv
@@ -90,6 +91,104 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Shared by all gunicorn workers: a table in the main database, created
+    # by migrate. Any shared backend works, e.g.
+    # RECIPES_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+    # RECIPES_CACHE_LOCATION=/var/tmp/foodgram_cache
+    'recipes': {
+        'BACKEND': os.getenv(
+            'RECIPES_CACHE_BACKEND',
+            default='django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': os.getenv(
+            'RECIPES_CACHE_LOCATION', default='foodgram_cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv(
+                'RECIPES_CACHE_MAX_ENTRIES', default=100000)),
+        },
+    },
+}
+
+RECIPES_CACHE_ALIAS = 'recipes'
+# Seconds a cached anonymous recipe response is served as fresh
+RECIPES_CACHE_TIMEOUT = 60
+# Seconds a stale response may still be served while one worker refills it
+RECIPES_CACHE_GRACE = 30
+RECIPES_CACHE_LOCK_TIMEOUT = 5
+# Seconds a user's favorite and shopping cart id sets stay cached
+MEMBERSHIP_CACHE_TIMEOUT = 60 * 60
+# Seconds a downloaded shopping list file stays cached, and the largest
+# file kept; bigger ones are streamed every time
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60
+SHOPPING_LIST_CACHE_MAX_SIZE = 256 * 1024
+# Directory shared by all workers for rendered PDF shopping lists, removed
+# once unused for SHOPPING_LIST_PDF_MAX_AGE seconds
+SHOPPING_LIST_PDF_DIR = os.getenv(
+    'SHOPPING_LIST_PDF_DIR',
+    default=os.path.join(tempfile.gettempdir(), 'foodgram-shopping-lists'))
+SHOPPING_LIST_PDF_MAX_AGE = 24 * 60 * 60
+# TrueType font with Cyrillic glyphs for PDF shopping lists
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+# PDF rendering processes per worker, and seconds before a render that
+# never finished may be queued again
+SHOPPING_LIST_PDF_WORKERS = 2
+SHOPPING_LIST_PDF_TIMEOUT = 60
+# Seconds the tag slug map used by the recipe filter stays cached
+TAG_MAP_CACHE_TIMEOUT = 60 * 60
+# Default and largest number of ingredient autocomplete suggestions
+INGREDIENT_AUTOCOMPLETE_LIMIT = 10
+INGREDIENT_AUTOCOMPLETE_MAX_LIMIT = 50
+# Directory shared by all workers for memory-mapped tag and ingredient
+# snapshots, removed once unused for REFERENCE_SNAPSHOT_MAX_AGE seconds
+REFERENCE_SNAPSHOT_DIR = os.getenv(
+    'REFERENCE_SNAPSHOT_DIR',
+    default=os.path.join(tempfile.gettempdir(), 'foodgram-snapshots'))
+REFERENCE_SNAPSHOT_MAX_AGE = 24 * 60 * 60
+# Seconds between checks of a worker's pantry index for recipes saved by
+# other workers, and the largest number of ingredients in a pantry query
+PANTRY_INDEX_SYNC_INTERVAL = 5
+PANTRY_MAX_INGREDIENTS = 100
+# MinHash signature length and LSH bands of similar recipes; every band
+# holds SIMILAR_NUM_HASHES // SIMILAR_BANDS hashes
+SIMILAR_NUM_HASHES = 128
+SIMILAR_BANDS = 32
+# Recipes sharing most buckets compared per similar recipes request, the
+# default and largest number of similar recipes, and the weight of tag
+# overlap when re-ranking by tags
+SIMILAR_MAX_CANDIDATES = 1000
+SIMILAR_RECIPES_LIMIT = 6
+SIMILAR_RECIPES_MAX_LIMIT = 30
+SIMILAR_TAG_WEIGHT = 0.25
+# Neighbours kept per recipe and recommendations kept per user by
+# build_recommendations, which reads at most the newest
+# RECOMMENDATION_MAX_USER_RECIPES favorites and cart recipes of a user
+RECOMMENDATION_NEIGHBOURS = 20
+RECOMMENDATIONS_PER_USER = 50
+RECOMMENDATION_MAX_USER_RECIPES = 200
+# Authors with more followers are merged into feeds on read instead of
+# having their recipes copied into every follower's timeline
+FEED_FANOUT_LIMIT = 1000
+# Recipes copied into a timeline when a user follows an author
+FEED_BACKFILL_LIMIT = 1000
+# Seconds after which a favorite or cart addition weighs half as much in
+# the trending score
+TRENDING_HALF_LIFE = 3 * 24 * 60 * 60
+
+# Server-Sent Events stream of followed authors' recipe changes, served by
+# foodgram.asgi only
+EVENTS_PATH = '/api/events/'
+# Seconds between keep-alive comments on an idle stream
+EVENTS_HEARTBEAT = 15
+# Events queued per connection before a slow client is disconnected
+EVENTS_CONNECTION_BUFFER = 64
+# Recent events kept for resuming streams with Last-Event-ID
+EVENTS_REPLAY_BUFFER = 1000
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -143,6 +242,10 @@ DATA_ROOT = os.path.join(BASE_DIR, 'data')
 
 BLACK_USERNAME_LIST = ('me',)
 
+# Render recipe list pages from raw rows instead of RecipeReadSerializer
+FAST_RECIPE_SERIALIZER = os.getenv(
+    'FAST_RECIPE_SERIALIZER', default='False') == 'True'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -158,6 +261,10 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.TokenAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ),
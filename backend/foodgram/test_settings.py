@@ -0,0 +1,31 @@
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import MIDDLEWARE
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE
+    if not middleware.startswith('debug_toolbar')
+]
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'recipes': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recipes',
+    },
+}
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+REFERENCE_SNAPSHOT_DIR = tempfile.mkdtemp(prefix='foodgram-snapshots-')
+SHOPPING_LIST_PDF_DIR = tempfile.mkdtemp(prefix='foodgram-shopping-lists-')
@@ -1,7 +1,35 @@
+from contextlib import contextmanager
+
 from django.contrib import admin
 
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingList, Tag)
+                     ShoppingCartItem, ShoppingList, Tag)
+from .search import search_recipes
+from .signals import touch_recipes
+
+
+@contextmanager
+def ingredients_changing(recipe_ids):
+    """Report the changes made to the ingredients of ``recipe_ids`` inside
+    the block to shopping carts and as changes of the recipes.
+
+    The API writes recipe ingredients in bulk and accounts for them itself;
+    the admin edits the rows one by one, without per-row signals.
+    """
+    recipe_ids = set(recipe_ids)
+    before = {pk: ShoppingCartItem.recipe_amounts(pk) for pk in recipe_ids}
+    yield
+    changed = []
+    for recipe_id, amounts in before.items():
+        after = ShoppingCartItem.recipe_amounts(recipe_id)
+        if after == amounts:
+            continue
+        changed.append(recipe_id)
+        ShoppingCartItem.update_recipe(recipe_id, {
+            pk: after.get(pk, 0) - amounts.get(pk, 0)
+            for pk in amounts.keys() | after.keys()
+        })
+    touch_recipes(changed)
 
 
 class IngredientsAmountInLine(admin.TabularInline):
@@ -19,9 +47,18 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('name', 'author', 'tags', 'pub_date',)
     inlines = [IngredientsAmountInLine, ]
 
+    def save_related(self, request, form, formsets, change):
+        with ingredients_changing([form.instance.pk]):
+            super().save_related(request, form, formsets, change)
+
     @staticmethod
     def amount_favorites(obj):
-        return obj.favorites.count()
+        return obj.favorites_count
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return search_recipes(queryset, search_term), False
 
 
 @admin.register(Ingredient)
@@ -46,15 +83,32 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
         'ingredient',
         'amount')
 
+    def save_model(self, request, obj, form, change):
+        recipe_ids = [obj.recipe_id]
+        if change:
+            recipe_ids.extend(RecipeIngredient.objects.filter(
+                pk=obj.pk).values_list('recipe_id', flat=True))
+        with ingredients_changing(recipe_ids):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with ingredients_changing([obj.recipe_id]):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with ingredients_changing(
+                queryset.values_list('recipe_id', flat=True)):
+            super().delete_queryset(request, queryset)
+
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'recipe')
+    list_display = ('id', 'user', 'recipe', 'added_at')
     empty_value_display = '-empty-'
 
 
 @admin.register(ShoppingList)
 class ShoppingListAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'recipe')
+    list_display = ('id', 'user', 'recipe', 'added_at')
     list_filter = ('user',)
     empty_value_display = '-empty-'
@@ -0,0 +1,29 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.models import Recipe
+from recipes.similarity import update_signatures
+
+
+class Command(BaseCommand):
+    help = ('Compute the MinHash signatures and LSH buckets of all recipes, '
+            'rewriting only the ones that changed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        last_pk = 0
+        checked = rewritten = 0
+        while True:
+            recipe_ids = list(Recipe.objects.filter(
+                pk__gt=last_pk).order_by('pk').values_list(
+                'pk', flat=True)[:options['batch_size']])
+            if not recipe_ids:
+                break
+            with transaction.atomic():
+                rewritten += update_signatures(recipe_ids)
+            checked += len(recipe_ids)
+            last_pk = recipe_ids[-1]
+        self.stdout.write(self.style.SUCCESS(
+            f'{checked} recipes checked, {rewritten} signatures rewritten'))
@@ -0,0 +1,20 @@
+from django.core.management import BaseCommand
+
+from recipes.recommendations import build
+
+
+class Command(BaseCommand):
+    help = ('Compute recipe neighbours from favorites and shopping carts '
+            'and the recommendations of every user')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Keep the neighbours and only refresh the users whose '
+                 'favorites or cart changed since the previous run')
+
+    def handle(self, *args, **options):
+        run = build(options['incremental'])
+        kind = 'incremental' if run.incremental else 'full'
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed recommendations of {run.users} users ({kind} run)'))
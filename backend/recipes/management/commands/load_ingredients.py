@@ -4,7 +4,7 @@ import os
 from django.conf import settings
 from django.core.management import BaseCommand
 
-from recipes.models import Ingredient
+from recipes.models import CatalogVersion, Ingredient
 
 
 class Command(BaseCommand):
@@ -16,4 +16,5 @@ class Command(BaseCommand):
             reader = csv.DictReader(file)
             Ingredient.objects.bulk_create(
                 Ingredient(**data) for data in reader)
+        CatalogVersion.bump(CatalogVersion.INGREDIENTS)
         self.stdout.write(self.style.SUCCESS('Ingredients added'))
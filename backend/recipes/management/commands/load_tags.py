@@ -4,7 +4,7 @@ import os
 from django.conf import settings
 from django.core.management import BaseCommand
 
-from recipes.models import Tag
+from recipes.models import CatalogVersion, Tag
 
 
 class Command(BaseCommand):
@@ -16,4 +16,5 @@ class Command(BaseCommand):
             reader = csv.DictReader(file)
             Tag.objects.bulk_create(
                 Tag(**data) for data in reader)
+        CatalogVersion.bump(CatalogVersion.TAGS)
         self.stdout.write(self.style.SUCCESS('Tags added'))
@@ -0,0 +1,13 @@
+from django.core.management import BaseCommand
+
+from recipes.models import TrendingEpoch
+
+
+class Command(BaseCommand):
+    help = ('Move the trending epoch to now and scale scores down; '
+            'run periodically, e.g. daily, to keep scores finite')
+
+    def handle(self, *args, **kwargs):
+        factor, updated = TrendingEpoch.rebase()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebased {updated} trending scores by {factor:.6g}'))
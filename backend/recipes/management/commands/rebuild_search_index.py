@@ -0,0 +1,28 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.models import Recipe
+from recipes.search import update_documents
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search documents of all recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        last_pk = 0
+        rebuilt = 0
+        while True:
+            recipe_ids = list(Recipe.objects.filter(
+                pk__gt=last_pk).order_by('pk').values_list(
+                'pk', flat=True)[:options['batch_size']])
+            if not recipe_ids:
+                break
+            with transaction.atomic():
+                update_documents(recipe_ids)
+            rebuilt += len(recipe_ids)
+            last_pk = recipe_ids[-1]
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt search documents of {rebuilt} recipes'))
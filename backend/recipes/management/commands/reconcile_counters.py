@@ -0,0 +1,69 @@
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe
+from users.models import Follow
+
+User = get_user_model()
+
+# (model, counter field, counted model, foreign key to ``model``)
+COUNTERS = (
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized counters and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report drift without fixing it')
+
+    def handle(self, *args, **options):
+        for model, field, counted, key in COUNTERS:
+            checked, drifted, total = self.reconcile(
+                model, field, counted, key,
+                options['batch_size'], options['dry_run'])
+            style = self.style.WARNING if drifted else self.style.SUCCESS
+            self.stdout.write(style(
+                f'{model.__name__}.{field}: {checked} checked, '
+                f'{drifted} drifted, total drift {total:+d}'))
+
+    @staticmethod
+    def reconcile(model, field, counted, key, batch_size, dry_run):
+        counts = counted.objects.filter(
+            **{key: OuterRef('pk')}
+        ).order_by().values(key).annotate(total=Count('pk')).values('total')
+        actual = Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+        checked = drifted = total = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                rows = list(model.objects.filter(
+                    pk__gt=last_pk
+                ).order_by('pk').annotate(
+                    actual=actual
+                ).values_list('pk', field, 'actual')[:batch_size])
+                if not rows:
+                    break
+                for pk, stored, counted_value in rows:
+                    delta = counted_value - stored
+                    if not delta:
+                        continue
+                    drifted += 1
+                    total += delta
+                    if not dry_run:
+                        # Apply the difference rather than the value so
+                        # that concurrent increments are not lost.
+                        model.objects.filter(pk=pk).update(
+                            **{field: F(field) + delta})
+            checked += len(rows)
+            last_pk = rows[-1][0]
+        return checked, drifted, total
@@ -0,0 +1,75 @@
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Q, Sum
+
+from recipes.models import RecipeIngredient, ShoppingCartItem
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Compare shopping cart totals with the aggregated ingredients '
+            'of the recipes in each cart')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Correct the totals that drifted')
+
+    def handle(self, *args, **options):
+        checked = drifted_users = drifted_items = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                user_ids = list(User.objects.filter(
+                    Q(shopping_list__isnull=False)
+                    | Q(shopping_cart_items__isnull=False),
+                    pk__gt=last_pk
+                ).order_by('pk').values_list(
+                    'pk', flat=True).distinct()[:options['batch_size']])
+                if not user_ids:
+                    break
+                for user_id, delta in self.compare(user_ids).items():
+                    drifted_users += 1
+                    drifted_items += len(delta)
+                    if options['fix']:
+                        # Apply the difference rather than the value so
+                        # that concurrent cart changes are not lost.
+                        ShoppingCartItem.apply([user_id], delta)
+            checked += len(user_ids)
+            last_pk = user_ids[-1]
+        style = self.style.WARNING if drifted_users else self.style.SUCCESS
+        self.stdout.write(style(
+            f'{checked} carts checked, {drifted_users} drifted, '
+            f'{drifted_items} totals '
+            f'{"fixed" if options["fix"] else "wrong"}'))
+
+    @staticmethod
+    def compare(user_ids):
+        """Per user, the amounts to add to the stored totals to match the
+        live aggregation; carts that match are left out."""
+        totals = RecipeIngredient.objects.filter(
+            recipe__shopping_list__user__in=user_ids
+        ).values_list(
+            'recipe__shopping_list__user', 'ingredient'
+        ).annotate(total=Sum('amount')).order_by()
+        expected = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in totals
+        }
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in
+            ShoppingCartItem.objects.filter(
+                user_id__in=user_ids).values_list(
+                'user_id', 'ingredient_id', 'amount')
+        }
+        drift = {}
+        for key in expected.keys() | stored.keys():
+            delta = expected.get(key, 0) - stored.get(key, 0)
+            if delta:
+                user_id, ingredient_id = key
+                drift.setdefault(user_id, {})[ingredient_id] = delta
+        return drift
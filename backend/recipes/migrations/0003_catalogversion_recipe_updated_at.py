@@ -0,0 +1,39 @@
+# Generated by Django 3.2.18 on 2026-10-18 11:04
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Catalog')),
+                ('version', models.PositiveIntegerField(default=0, verbose_name='Version')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Update date')),
+            ],
+            options={
+                'verbose_name': 'Catalog version',
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='favorite',
+            options={'verbose_name': 'Favorites'},
+        ),
+        migrations.AlterModelOptions(
+            name='shoppinglist',
+            options={'verbose_name': 'Shopping list'},
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Update date'),
+        ),
+    ]
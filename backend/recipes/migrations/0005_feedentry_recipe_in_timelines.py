@@ -0,0 +1,84 @@
+# Generated by Django 3.2.18 on 2026-10-18 11:12
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    # The same as fanning out every existing recipe and backfilling every
+    # existing follow: recipes of authors with too many followers are merged
+    # into the feed on read, the newest recipes of the others are copied.
+    Follow = apps.get_model('users', 'Follow')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    crowded = Follow.objects.values('author').annotate(
+        followers=Count('pk')
+    ).filter(followers__gt=settings.FEED_FANOUT_LIMIT).values('author')
+    Recipe.objects.filter(author__in=crowded).update(in_timelines=False)
+    author_id, recipes = None, []
+    for user_id, followed_id in Follow.objects.order_by(
+            'author', 'user').values_list('user', 'author').iterator():
+        if followed_id != author_id:
+            author_id = followed_id
+            recipes = list(Recipe.objects.filter(
+                author_id=author_id, in_timelines=True
+            ).order_by('-pub_date', '-id').values_list(
+                'pk', 'pub_date')[:settings.FEED_BACKFILL_LIMIT])
+        FeedEntry.objects.bulk_create(
+            [FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                       pub_date=pub_date)
+             for recipe_id, pub_date in recipes],
+            ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0004_recipe_recipe_pub_date_id_idx'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Pub date')),
+            ],
+            options={
+                'verbose_name': 'Feed entry',
+                'verbose_name_plural': 'Feed entries',
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_timelines',
+            field=models.BooleanField(default=True, verbose_name='Copied to follower timelines'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('in_timelines', False)), fields=['author', '-pub_date', '-id'], name='recipe_merged_feed_idx'),
+        ),
+        migrations.AddField(
+            model_name='feedentry',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.recipe', verbose_name='Recipe'),
+        ),
+        migrations.AddField(
+            model_name='feedentry',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL, verbose_name='User'),
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='feed_entry_timeline_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_entry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
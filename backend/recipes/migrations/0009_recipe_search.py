@@ -0,0 +1,28 @@
+from django.db import migrations
+
+from recipes.search import create_table, drop_table, update_documents
+
+
+def create_search_table(apps, schema_editor):
+    create_table(schema_editor)
+
+
+def drop_search_table(apps, schema_editor):
+    drop_table(schema_editor)
+
+
+def fill_search_table(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    update_documents(Recipe.objects.values_list('pk', flat=True))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_added_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+        migrations.RunPython(fill_search_table, migrations.RunPython.noop),
+    ]
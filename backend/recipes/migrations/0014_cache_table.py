@@ -0,0 +1,21 @@
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    # Creates the tables of the database cache backends in settings, such
+    # as the shared recipes cache; other backends are skipped.
+    call_command(
+        'createcachetable', database=schema_editor.connection.alias,
+        verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_shoppingcartitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,10 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -16,11 +20,19 @@ class Favorite(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Recipe',
         related_name='favorites', )
+    added_at = models.DateTimeField(
+        verbose_name='Added at',
+        auto_now_add=True, )
 
     class Meta:
         verbose_name = 'Favorites'
         constraints = [models.UniqueConstraint(fields=['user', 'recipe'],
                                                name='unique_favorite')]
+        indexes = [
+            models.Index(
+                fields=['user', '-added_at', '-recipe'],
+                name='favorite_user_added_idx'),
+        ]
 
 
 class ShoppingList(models.Model):
@@ -34,11 +46,19 @@ class ShoppingList(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Recipe',
         related_name='shopping_list', )
+    added_at = models.DateTimeField(
+        verbose_name='Added at',
+        auto_now_add=True, )
 
     class Meta:
         verbose_name = 'Shopping list'
         constraints = [models.UniqueConstraint(fields=['user', 'recipe'],
                                                name='unique_basket')]
+        indexes = [
+            models.Index(
+                fields=['user', '-added_at', '-recipe'],
+                name='shopping_list_user_added_idx'),
+        ]
 
 
 class Ingredient(models.Model):
@@ -119,10 +139,41 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Update date',
+        auto_now=True,
+        db_index=True,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Times favorited',
+        default=0,
+    )
+    trending_score = models.FloatField(
+        verbose_name='Trending score',
+        default=0,
+    )
+    in_timelines = models.BooleanField(
+        verbose_name='Copied to follower timelines',
+        default=True,
+    )
 
     class Meta:
         verbose_name = 'Recipe'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'),
+            models.Index(
+                fields=['-trending_score', '-id'],
+                name='recipe_trending_idx'),
+            models.Index(
+                fields=['-favorites_count', '-id'],
+                name='recipe_popular_idx'),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_merged_feed_idx',
+                condition=models.Q(in_timelines=False)),
+        ]
 
     def __str__(self):
         return f'{self.name}'
@@ -154,3 +205,332 @@ class RecipeIngredient(models.Model):
 
     def __str__(self):
         return f'{self.ingredient}'
+
+
+class ShoppingCartItem(models.Model):
+    """Total amount of an ingredient over the recipes in a user's cart.
+
+    Kept up to date as recipes enter and leave the cart and as the
+    ingredients of recipes in it change, so that the shopping list is read
+    without aggregating ``RecipeIngredient``.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='User',
+        related_name='shopping_cart_items', )
+    ingredient = models.ForeignKey(
+        'Ingredient',
+        on_delete=models.CASCADE,
+        verbose_name='Ingredient',
+        related_name='shopping_cart_items', )
+    amount = models.PositiveIntegerField(
+        verbose_name='Total amount', )
+
+    class Meta:
+        verbose_name = 'Shopping cart item'
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'ingredient'], name='unique_shopping_cart_item')]
+
+    @staticmethod
+    def recipe_amounts(recipe_id):
+        amounts = {}
+        for ingredient_id, amount in RecipeIngredient.objects.filter(
+                recipe_id=recipe_id).values_list('ingredient_id', 'amount'):
+            amounts[ingredient_id] = amounts.get(ingredient_id, 0) + amount
+        return amounts
+
+    @classmethod
+    def apply(cls, user_ids, amounts):
+        """Add ``amounts`` (ingredient id to a signed amount) to the carts
+        of ``user_ids``; totals that drop to zero are removed."""
+        amounts = {pk: amount for pk, amount in amounts.items() if amount}
+        user_ids = sorted(user_ids)
+        if not amounts or not user_ids:
+            return
+        # Locking the users applies concurrent changes of one cart one
+        # after another, including the creation of missing totals.
+        list(User.objects.select_for_update().filter(
+            pk__in=user_ids).order_by('pk').values_list('pk'))
+        items = {
+            (item.user_id, item.ingredient_id): item
+            for item in cls.objects.filter(
+                user_id__in=user_ids, ingredient_id__in=amounts)
+        }
+        changed, emptied = [], []
+        for item in items.values():
+            item.amount += amounts[item.ingredient_id]
+            if item.amount > 0:
+                changed.append(item)
+            else:
+                emptied.append(item.pk)
+        cls.objects.bulk_update(changed, ['amount'], batch_size=1000)
+        cls.objects.filter(pk__in=emptied).delete()
+        cls.objects.bulk_create([
+            cls(user_id=user_id, ingredient_id=ingredient_id, amount=amount)
+            for user_id in user_ids
+            for ingredient_id, amount in amounts.items()
+            if amount > 0 and (user_id, ingredient_id) not in items
+        ], batch_size=1000)
+
+    @classmethod
+    def add_recipe(cls, user_id, recipe_id, sign=1):
+        amounts = cls.recipe_amounts(recipe_id)
+        cls.apply([user_id], {
+            pk: sign * amount for pk, amount in amounts.items()})
+
+    @classmethod
+    def update_recipe(cls, recipe_id, delta):
+        """Apply a change of a recipe's ingredient amounts (ingredient id
+        to signed difference) to every cart holding the recipe."""
+        if not any(delta.values()):
+            return
+        user_ids = list(ShoppingList.objects.filter(
+            recipe_id=recipe_id).values_list('user_id', flat=True))
+        for start in range(0, len(user_ids), 1000):
+            cls.apply(user_ids[start:start + 1000], delta)
+
+
+class FeedEntry(models.Model):
+    """A recipe in the timeline of one of its author's followers.
+
+    Recipes of authors with more than ``FEED_FANOUT_LIMIT`` followers are
+    not copied here (``Recipe.in_timelines`` is False) and are merged into
+    the feed on read instead.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='User',
+        related_name='feed_entries', )
+    recipe = models.ForeignKey(
+        'Recipe',
+        on_delete=models.CASCADE,
+        verbose_name='Recipe',
+        related_name='feed_entries', )
+    pub_date = models.DateTimeField(
+        verbose_name='Pub date', )
+
+    class Meta:
+        verbose_name = 'Feed entry'
+        verbose_name_plural = 'Feed entries'
+        constraints = [models.UniqueConstraint(fields=['user', 'recipe'],
+                                               name='unique_feed_entry')]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_entry_timeline_idx'),
+        ]
+
+    @classmethod
+    def fan_out(cls, recipe):
+        followers = recipe.author.author.values_list('user_id', flat=True)
+        if followers.count() > settings.FEED_FANOUT_LIMIT:
+            Recipe.objects.filter(pk=recipe.pk).update(in_timelines=False)
+            return
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, recipe=recipe, pub_date=recipe.pub_date)
+             for user_id in followers],
+            ignore_conflicts=True)
+
+    @classmethod
+    def backfill(cls, user_id, author_id):
+        recipes = Recipe.objects.filter(
+            author_id=author_id, in_timelines=True
+        ).order_by('-pub_date', '-id').values_list(
+            'pk', 'pub_date')[:settings.FEED_BACKFILL_LIMIT]
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+             for recipe_id, pub_date in recipes],
+            ignore_conflicts=True)
+
+    @classmethod
+    def drop(cls, user_id, author_id):
+        cls.objects.filter(
+            user_id=user_id, recipe__author_id=author_id).delete()
+
+
+class TrendingEpoch(models.Model):
+    """Reference time of ``Recipe.trending_score``.
+
+    An event at time ``t`` adds ``weight * 2 ** ((t - started_at) /
+    TRENDING_HALF_LIFE)`` to the score, so older events weigh less relative
+    to newer ones without ever rewriting the scores. ``rebase`` moves the
+    epoch forward and scales the scores down to keep them finite.
+    """
+    started_at = models.DateTimeField(
+        verbose_name='Started at',
+        default=timezone.now, )
+
+    class Meta:
+        verbose_name = 'Trending epoch'
+
+    def __str__(self):
+        return f'{self.started_at:%Y-%m-%d %H:%M}'
+
+    @staticmethod
+    def growth(start, end):
+        return 2 ** (
+            (end - start).total_seconds() / settings.TRENDING_HALF_LIFE)
+
+    @classmethod
+    def current(cls):
+        return cls.objects.get_or_create(pk=1)[0]
+
+    @classmethod
+    def add_score(cls, recipe_id, weight, at=None):
+        """Add an event of ``weight`` that happened ``at`` (now by default);
+        negative weights remove one added at that time."""
+        amount = weight * cls.growth(
+            cls.current().started_at, at or timezone.now())
+        Recipe.objects.filter(pk=recipe_id).update(
+            trending_score=Greatest(F('trending_score') + amount, 0.0))
+
+    @classmethod
+    def rebase(cls):
+        with transaction.atomic():
+            epoch = cls.objects.select_for_update().get_or_create(pk=1)[0]
+            now = timezone.now()
+            factor = 1 / cls.growth(epoch.started_at, now)
+            updated = Recipe.objects.filter(trending_score__gt=0).update(
+                trending_score=F('trending_score') * factor)
+            epoch.started_at = now
+            epoch.save(update_fields=['started_at'])
+        return factor, updated
+
+
+class CatalogVersion(models.Model):
+    name = models.CharField(
+        verbose_name='Catalog',
+        max_length=50,
+        unique=True, )
+    version = models.PositiveIntegerField(
+        verbose_name='Version',
+        default=0, )
+    updated_at = models.DateTimeField(
+        verbose_name='Update date',
+        default=timezone.now, )
+
+    TAGS = 'tags'
+    INGREDIENTS = 'ingredients'
+
+    class Meta:
+        verbose_name = 'Catalog version'
+
+    def __str__(self):
+        return f'{self.name} v{self.version}'
+
+    @classmethod
+    def get(cls, name):
+        catalog = cls.objects.filter(name=name).first()
+        return catalog or cls(name=name, updated_at=None)
+
+    @classmethod
+    def bump(cls, name):
+        updated = cls.objects.filter(name=name).update(
+            version=F('version') + 1, updated_at=timezone.now())
+        if not updated:
+            cls.objects.get_or_create(name=name, defaults={'version': 1})
+
+
+class RecipeSignature(models.Model):
+    """MinHash signature of the ingredient set of a recipe.
+
+    Maintained by ``recipes.similarity``; ``minhash`` holds
+    ``SIMILAR_NUM_HASHES`` little-endian uint32 values.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Recipe',
+        related_name='signature', )
+    minhash = models.BinaryField(
+        verbose_name='MinHash signature', )
+
+    class Meta:
+        verbose_name = 'Recipe signature'
+
+
+class RecipeBucket(models.Model):
+    """Locality-sensitive hashing bucket of one band of a signature."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Recipe',
+        related_name='buckets', )
+    bucket = models.BigIntegerField(
+        verbose_name='Bucket', )
+
+    class Meta:
+        verbose_name = 'Recipe bucket'
+        indexes = [
+            models.Index(
+                fields=['bucket', 'recipe'], name='recipe_bucket_idx'),
+        ]
+
+
+class RecipeNeighbour(models.Model):
+    """A recipe often favorited or carted by the users of another one."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Recipe',
+        related_name='neighbours', )
+    neighbour = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Neighbour',
+        related_name='+', )
+    score = models.FloatField(
+        verbose_name='Similarity', )
+
+    class Meta:
+        verbose_name = 'Recipe neighbour'
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'], name='recipe_neighbour_idx'),
+        ]
+
+
+class Recommendation(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='User',
+        related_name='recommendations', )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Recipe',
+        related_name='recommendations', )
+    score = models.FloatField(
+        verbose_name='Score', )
+
+    class Meta:
+        verbose_name = 'Recommendation'
+        constraints = [models.UniqueConstraint(fields=['user', 'recipe'],
+                                               name='unique_recommendation')]
+        indexes = [
+            models.Index(
+                fields=['user', '-score', '-recipe'],
+                name='recommendation_user_idx'),
+        ]
+
+
+class RecommendationRun(models.Model):
+    """A run of ``build_recommendations``; the latest one bounds the
+    users refreshed by the next incremental run."""
+    started_at = models.DateTimeField(
+        verbose_name='Started at', )
+    incremental = models.BooleanField(
+        verbose_name='Incremental', )
+    users = models.PositiveIntegerField(
+        verbose_name='Users refreshed', )
+
+    class Meta:
+        verbose_name = 'Recommendation run'
+        ordering = ('-started_at',)
+
+    def __str__(self):
+        return f'{self.started_at:%Y-%m-%d %H:%M}'
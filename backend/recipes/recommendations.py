@@ -0,0 +1,215 @@
+"""Item-item collaborative filtering over favorites and shopping carts.
+
+A user interacted with a recipe if it is in their favorites or shopping
+cart. Two recipes are similar when the same users interacted with both:
+the cosine similarity of their user sets. Only the top
+``RECOMMENDATION_NEIGHBOURS`` neighbours of every recipe are kept in
+``RecipeNeighbour``, and a user's recommendations are the recipes with the
+highest summed similarity to the ones they interacted with, stored in
+``Recommendation``. Everything is computed on flat numpy arrays of ids.
+"""
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (Favorite, RecipeNeighbour, Recommendation,
+                     RecommendationRun, ShoppingList)
+
+User = get_user_model()
+
+# Co-occurring pairs expanded at once.
+CHUNK_PAIRS = 5000000
+BATCH_SIZE = 5000
+
+
+def load_interactions(user_ids=None):
+    """Distinct ``(user_id, recipe_id)`` interactions sorted by user and
+    most recently added first, at most ``RECOMMENDATION_MAX_USER_RECIPES``
+    per user."""
+    rows = []
+    for model in (Favorite, ShoppingList):
+        queryset = model.objects.all()
+        if user_ids is not None:
+            queryset = queryset.filter(user_id__in=user_ids)
+        rows.extend(
+            (user_id, recipe_id, added_at.timestamp())
+            for user_id, recipe_id, added_at in queryset.values_list(
+                'user_id', 'recipe_id', 'added_at').iterator(
+                chunk_size=10000))
+    rows = np.array(rows, dtype=np.float64).reshape(-1, 3)
+    users, recipes = rows[:, 0].astype(np.int64), rows[:, 1].astype(np.int64)
+    added = rows[:, 2]
+    # A recipe both favorited and in the cart counts once, when last added.
+    order = np.lexsort((-added, recipes, users))
+    users, recipes, added = users[order], recipes[order], added[order]
+    first = np.ones(len(users), dtype=bool)
+    first[1:] = (users[1:] != users[:-1]) | (recipes[1:] != recipes[:-1])
+    users, recipes, added = users[first], recipes[first], added[first]
+    order = np.lexsort((-recipes, -added, users))
+    users, recipes = users[order], recipes[order]
+    keep = group_ranks(users) < settings.RECOMMENDATION_MAX_USER_RECIPES
+    return users[keep], recipes[keep]
+
+
+def group_ranks(groups):
+    """Position of every element within its run of equal ``groups``."""
+    if not len(groups):
+        return np.empty(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    sizes = np.diff(np.r_[starts, len(groups)])
+    return np.arange(len(groups)) - np.repeat(starts, sizes)
+
+
+def top_per_group(groups, values, scores, limit):
+    """The ``limit`` best scored ``values`` of every group."""
+    order = np.lexsort((-values, -scores, groups))
+    groups, values, scores = groups[order], values[order], scores[order]
+    keep = group_ranks(groups) < limit
+    return groups[keep], values[keep], scores[keep]
+
+
+def expand(starts, sizes):
+    """Indices ``start .. start + size`` of every ``(start, size)``."""
+    total = sizes.sum()
+    offsets = np.arange(total) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    return np.repeat(starts, sizes) + offsets
+
+
+def user_chunks(users, weights):
+    """``(start, stop)`` slices of interactions sorted by user, each
+    holding whole users and about ``CHUNK_PAIRS`` of ``weights``."""
+    starts = np.r_[np.flatnonzero(np.r_[True, users[1:] != users[:-1]]),
+                   len(users)]
+    totals = np.r_[0, np.cumsum(weights)][starts]
+    first = 0
+    while first < len(starts) - 1:
+        last = max(first + 1, np.searchsorted(
+            totals, totals[first] + CHUNK_PAIRS, side='right') - 1)
+        yield starts[first], starts[last]
+        first = last
+
+
+def neighbours(users, recipes):
+    """Top neighbours of every recipe as ``(recipe, neighbour, score)``
+    arrays, from interactions sorted by user."""
+    if not len(recipes):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0)
+    span = int(recipes.max()) + 1
+    group_sizes = np.unique(users, return_counts=True)[1]
+    # Every interaction pairs with all interactions of its user.
+    user_sizes = np.repeat(group_sizes, group_sizes)
+    keys, counts = [], []
+    for start, stop in user_chunks(users, user_sizes):
+        chunk_users = users[start:stop]
+        sizes = user_sizes[start:stop]
+        firsts = start + np.searchsorted(chunk_users, chunk_users)
+        left = np.repeat(recipes[start:stop], sizes)
+        right = recipes[expand(firsts, sizes)]
+        distinct = left != right
+        chunk_keys, chunk_counts = np.unique(
+            left[distinct] * span + right[distinct], return_counts=True)
+        keys.append(chunk_keys)
+        counts.append(chunk_counts)
+    keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate(counts))
+    left, right = keys // span, keys % span
+    popularity = np.bincount(recipes, minlength=span)
+    scores = counts / np.sqrt(popularity[left] * popularity[right])
+    return top_per_group(
+        left, right, scores, settings.RECOMMENDATION_NEIGHBOURS)
+
+
+def recommend(users, recipes, neighbour_recipes, neighbour_ids, scores):
+    """Top recommendations of the users of ``users``/``recipes``
+    interactions as ``(user, recipe, score)`` arrays.
+
+    ``neighbour_*`` are the neighbour arrays sorted by recipe.
+    """
+    if not len(users) or not len(neighbour_recipes):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0)
+    span = int(max(recipes.max(), neighbour_ids.max())) + 1
+    first = np.searchsorted(neighbour_recipes, recipes, side='left')
+    count = np.searchsorted(neighbour_recipes, recipes, side='right') - first
+    chunks = []
+    for start, stop in user_chunks(users, count):
+        positions = expand(first[start:stop], count[start:stop])
+        keys = np.repeat(users[start:stop], count[start:stop]) * span
+        keys, inverse = np.unique(
+            keys + neighbour_ids[positions], return_inverse=True)
+        totals = np.bincount(inverse, weights=scores[positions])
+        # Recipes the user already has are not recommended.
+        fresh = ~np.isin(
+            keys, users[start:stop] * span + recipes[start:stop])
+        chunks.append(top_per_group(
+            keys[fresh] // span, keys[fresh] % span, totals[fresh],
+            settings.RECOMMENDATIONS_PER_USER))
+    return tuple(np.concatenate(arrays) for arrays in zip(*chunks))
+
+
+def load_neighbours():
+    rows = np.array(
+        RecipeNeighbour.objects.order_by('recipe_id').values_list(
+            'recipe_id', 'neighbour_id', 'score'),
+        dtype=np.float64).reshape(-1, 3)
+    return (rows[:, 0].astype(np.int64), rows[:, 1].astype(np.int64),
+            rows[:, 2])
+
+
+def save_neighbours(recipes, neighbour_ids, scores):
+    with transaction.atomic():
+        RecipeNeighbour.objects.all().delete()
+        RecipeNeighbour.objects.bulk_create((
+            RecipeNeighbour(recipe_id=recipe_id, neighbour_id=neighbour_id,
+                            score=score)
+            for recipe_id, neighbour_id, score in zip(
+                recipes.tolist(), neighbour_ids.tolist(), scores.tolist())
+        ), batch_size=BATCH_SIZE)
+
+
+def save_recommendations(user_ids, users, recipes, scores):
+    """Replace the recommendations of ``user_ids`` (None for everyone)."""
+    with transaction.atomic():
+        stale = Recommendation.objects.all()
+        if user_ids is not None:
+            stale = stale.filter(user_id__in=user_ids)
+        stale.delete()
+        Recommendation.objects.bulk_create((
+            Recommendation(user_id=user_id, recipe_id=recipe_id, score=score)
+            for user_id, recipe_id, score in zip(
+                users.tolist(), recipes.tolist(), scores.tolist())
+        ), batch_size=BATCH_SIZE)
+
+
+def build(incremental=False):
+    """Refresh recommendations; returns the run.
+
+    A full build recomputes the neighbours and the recommendations of
+    every user. An incremental one keeps the neighbours and refreshes the
+    users whose favorites or cart changed since the previous run started.
+    """
+    started_at = timezone.now()
+    previous = RecommendationRun.objects.first()
+    if incremental and previous is not None:
+        user_ids = list(User.objects.filter(
+            interactions_changed_at__gte=previous.started_at
+        ).values_list('pk', flat=True))
+        users, recipes = load_interactions(user_ids)
+        neighbour_arrays = load_neighbours()
+    else:
+        incremental = False
+        user_ids = None
+        users, recipes = load_interactions()
+        neighbour_arrays = neighbours(users, recipes)
+        save_neighbours(*neighbour_arrays)
+    order = np.argsort(neighbour_arrays[0], kind='stable')
+    recommended = recommend(
+        users, recipes, *(array[order] for array in neighbour_arrays))
+    save_recommendations(user_ids, *recommended)
+    return RecommendationRun.objects.create(
+        started_at=started_at, incremental=incremental,
+        users=len(user_ids) if user_ids is not None else len(np.unique(
+            users)))
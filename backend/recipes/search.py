@@ -0,0 +1,155 @@
+"""Full-text search over recipe names, ingredient names and descriptions.
+
+Each recipe has a row in ``recipes_recipe_search``, refreshed whenever
+``recipes_changed`` fires. On PostgreSQL the table holds a weighted
+``tsvector`` with Russian and English stems behind a GIN index; on SQLite
+it is an FTS5 table using the Porter stemmer, where Russian query words
+lose their endings and every term matches as a prefix. Other databases
+fall back to ``icontains`` without ranking.
+"""
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+TABLE = 'recipes_recipe_search'
+BATCH_SIZE = 500
+
+# Matches tsvector weights A, B and C with bm25 column weights.
+FTS5_WEIGHTS = (10.0, 5.0, 1.0)
+
+DOCUMENTS_SQL = '''
+    SELECT recipe.id, recipe.name, COALESCE(ingredients.names, ''),
+           recipe.text
+    FROM recipes_recipe recipe
+    LEFT JOIN (
+        SELECT link.recipe_id, {aggregate} AS names
+        FROM recipes_recipeingredient link
+        JOIN recipes_ingredient ingredient
+            ON ingredient.id = link.ingredient_id
+        WHERE link.recipe_id IN ({ids})
+        GROUP BY link.recipe_id
+    ) ingredients ON ingredients.recipe_id = recipe.id
+    WHERE recipe.id IN ({ids})
+'''
+
+POSTGRES_VECTOR = ' || '.join(
+    f"setweight(to_tsvector('{config}', {column}), '{weight}')"
+    for column, weight in (('name', 'A'), ('ingredients', 'B'), ('text', 'C'))
+    for config in ('russian', 'english')
+)
+POSTGRES_QUERY = (
+    "(websearch_to_tsquery('russian', %s) || "
+    "websearch_to_tsquery('english', %s))")
+
+
+def create_table(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE TABLE {TABLE} ('
+            'recipe_id bigint PRIMARY KEY '
+            'REFERENCES recipes_recipe (id) ON DELETE CASCADE, '
+            'document tsvector NOT NULL)')
+        schema_editor.execute(
+            f'CREATE INDEX {TABLE}_document ON {TABLE} USING gin (document)')
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {TABLE} USING fts5('
+            'name, ingredients, text, '
+            "tokenize = 'porter unicode61 remove_diacritics 2')")
+
+
+def drop_table(schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+def update_documents(recipe_ids):
+    """Rebuild the search rows of ``recipe_ids``; missing recipes drop out."""
+    recipe_ids = list(recipe_ids)
+    vendor = connection.vendor
+    if vendor not in ('postgresql', 'sqlite'):
+        return
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        batch = recipe_ids[start:start + BATCH_SIZE]
+        ids = ', '.join(['%s'] * len(batch))
+        if vendor == 'postgresql':
+            documents = DOCUMENTS_SQL.format(
+                aggregate="string_agg(ingredient.name, ' ')", ids=ids)
+            insert = (
+                f'INSERT INTO {TABLE} (recipe_id, document) '
+                f'SELECT id, {POSTGRES_VECTOR} '
+                f'FROM ({documents}) source (id, name, ingredients, text)')
+            delete = f'DELETE FROM {TABLE} WHERE recipe_id IN ({ids})'
+        else:
+            documents = DOCUMENTS_SQL.format(
+                aggregate="group_concat(ingredient.name, ' ')", ids=ids)
+            insert = (
+                f'INSERT INTO {TABLE} (rowid, name, ingredients, text) '
+                f'{documents}')
+            delete = f'DELETE FROM {TABLE} WHERE rowid IN ({ids})'
+        with connection.cursor() as cursor:
+            cursor.execute(delete, batch)
+            cursor.execute(insert, batch * 2)
+
+
+# Inflectional endings cut from Russian query words before prefix matching,
+# longest first; SQLite has no Russian stemmer.
+RUSSIAN_ENDINGS = sorted((
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ой', 'ей',
+    'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ую', 'юю', 'ая', 'яя', 'ое', 'ее',
+    'ые', 'ие', 'ый', 'ий', 'ов', 'ев', 'а', 'я', 'ы', 'и', 'у', 'ю', 'о',
+    'е', 'ь', 'й',
+), key=len, reverse=True)
+
+
+def russian_stem(word):
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def fts5_query(text):
+    terms = (
+        russian_stem(term) if re.match('[а-яё]', term) else term
+        for term in re.findall(r'\w+', text.lower()) if len(term) > 1
+    )
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_recipes(queryset, text):
+    """Recipes matching ``text``, annotated with ``search_rank`` and ordered
+    by it, best first."""
+    vendor = connection.vendor
+    if vendor == 'sqlite':
+        query = fts5_query(text)
+        if not query:
+            return queryset.none()
+        # A correlated MATCH per row would rescan the term lists for every
+        # candidate, so the FTS table is joined and bm25 read from the join.
+        weights = ', '.join(str(weight) for weight in FTS5_WEIGHTS)
+        return queryset.extra(
+            tables=[TABLE],
+            where=[f'{TABLE} MATCH %s', f'{TABLE}.rowid = recipes_recipe.id'],
+            params=[query],
+        ).annotate(search_rank=RawSQL(
+            f'-bm25({TABLE}, {weights})', (), output_field=FloatField())
+        ).order_by('-search_rank', '-id')
+    if vendor != 'postgresql':
+        return queryset.filter(
+            Q(name__icontains=text) | Q(text__icontains=text)
+            | Q(recipe_ingredients__ingredient__name__icontains=text)
+        ).distinct()
+    params = (text, text)
+    matches = RawSQL(
+        f'SELECT recipe_id FROM {TABLE} '
+        f'WHERE document @@ {POSTGRES_QUERY}', params)
+    rank = RawSQL(
+        f'SELECT ts_rank(document, {POSTGRES_QUERY}) FROM {TABLE} '
+        f'WHERE recipe_id = recipes_recipe.id', params,
+        output_field=FloatField())
+    return queryset.filter(pk__in=matches).annotate(
+        search_rank=rank).order_by('-search_rank', '-id')
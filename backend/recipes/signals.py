@@ -0,0 +1,184 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from users.models import Follow
+
+from .models import (CatalogVersion, Favorite, FeedEntry, Ingredient, Recipe,
+                     ShoppingCartItem, ShoppingList, Tag, TrendingEpoch)
+from .search import update_documents
+from .similarity import update_signatures
+
+User = get_user_model()
+
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+# Weight of a favorite or shopping cart addition in the trending score.
+TRENDING_WEIGHTS = {Favorite: 1.0, ShoppingList: 0.5}
+
+# Sent with ``recipe_ids`` whenever the public representation of recipes
+# changes: the recipe itself, its ingredients, tags or author profile.
+# ``created`` is set when the change is the creation of the recipe.
+recipes_changed = Signal()
+
+
+def touch_recipes(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    Recipe.objects.filter(pk__in=recipe_ids).update(updated_at=timezone.now())
+    recipes_changed.send(sender=Recipe, recipe_ids=recipe_ids)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(instance, created=False, **kwargs):
+    recipes_changed.send(
+        sender=Recipe, recipe_ids=[instance.pk], created=created)
+
+
+@receiver(recipes_changed)
+def refresh_search_documents(recipe_ids, **kwargs):
+    transaction.on_commit(partial(update_documents, recipe_ids))
+
+
+@receiver(recipes_changed)
+def refresh_signatures(recipe_ids, **kwargs):
+    transaction.on_commit(partial(update_signatures, recipe_ids))
+
+
+def change_counter(model, pk, field, delta):
+    """Add ``delta`` to a counter column in the current transaction."""
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+        FeedEntry.fan_out(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_removed(instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_added(instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_removed(instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+def author_followed(instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'followers_count', 1)
+        FeedEntry.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def author_unfollowed(instance, **kwargs):
+    change_counter(User, instance.author_id, 'followers_count', -1)
+    FeedEntry.drop(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+def trending_added(sender, instance, created, **kwargs):
+    if created:
+        TrendingEpoch.add_score(instance.recipe_id, TRENDING_WEIGHTS[sender])
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingList)
+def trending_removed(sender, instance, **kwargs):
+    # Removes exactly what the addition contributed, however long ago.
+    TrendingEpoch.add_score(
+        instance.recipe_id, -TRENDING_WEIGHTS[sender], instance.added_at)
+
+
+@receiver(post_save, sender=ShoppingList)
+def cart_recipe_added(instance, created, **kwargs):
+    if created:
+        ShoppingCartItem.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=ShoppingList)
+def cart_recipe_removed(instance, **kwargs):
+    # Runs before the delete so that the ingredients of a recipe deleted
+    # together with its cart rows can still be subtracted.
+    ShoppingCartItem.add_recipe(
+        instance.user_id, instance.recipe_id, sign=-1)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingList)
+def interactions_changed(instance, created=True, **kwargs):
+    # Read by the incremental runs of build_recommendations.
+    if created:
+        User.objects.filter(pk=instance.user_id).update(
+            interactions_changed_at=timezone.now())
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(instance, created, **kwargs):
+    CatalogVersion.bump(CatalogVersion.TAGS)
+    if not created:
+        touch_recipes(instance.recipes.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleted(instance, **kwargs):
+    touch_recipes(instance.recipes.values_list('pk', flat=True))
+    CatalogVersion.bump(CatalogVersion.TAGS)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(instance, created, **kwargs):
+    CatalogVersion.bump(CatalogVersion.INGREDIENTS)
+    if not created:
+        touch_recipes(instance.recipe_ingredients.values_list(
+            'recipe_id', flat=True))
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_deleted(instance, **kwargs):
+    # Recipe ingredients are changed without per-row signals: the API saves
+    # the recipe afterwards and the admin reports its edits itself, so only
+    # the cascade from a deleted ingredient has to touch its recipes here.
+    touch_recipes(instance.recipe_ingredients.values_list(
+        'recipe_id', flat=True).distinct())
+    CatalogVersion.bump(CatalogVersion.INGREDIENTS)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        touch_recipes(pk_set if reverse else [instance.pk])
+    elif action == 'pre_clear':
+        touch_recipes(
+            instance.recipes.values_list('pk', flat=True)
+            if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=User)
+def author_changed(instance, created, update_fields, **kwargs):
+    if created or (update_fields and not AUTHOR_FIELDS & set(update_fields)):
+        return
+    touch_recipes(instance.recipes.values_list('pk', flat=True))
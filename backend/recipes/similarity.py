@@ -0,0 +1,148 @@
+"""Similar recipes by the Jaccard similarity of their ingredient sets.
+
+Every recipe with ingredients has a MinHash signature in
+``RecipeSignature``: the minimum of ``SIMILAR_NUM_HASHES`` universal hashes
+over its ingredient ids, so that the share of equal positions in two
+signatures estimates the Jaccard similarity of the two sets. Signatures are
+split into ``SIMILAR_BANDS`` bands and every band hashed into a
+``RecipeBucket``; recipes sharing a bucket are the candidates compared for
+a recipe, instead of the whole catalog.
+"""
+import numpy as np
+from django.conf import settings
+from django.db.models import Count
+
+from .models import Recipe, RecipeBucket, RecipeIngredient, RecipeSignature
+
+PRIME = (1 << 31) - 1
+# Recipes hashed at once; bounds the (ingredients, hashes) matrix.
+CHUNK_SIZE = 5000
+BUCKET_MULTIPLIER = np.uint64(1000003)
+
+
+def hash_functions():
+    # A fixed seed keeps signatures comparable across processes and runs.
+    rng = np.random.default_rng(20)
+    size = settings.SIMILAR_NUM_HASHES
+    return (rng.integers(1, PRIME, size=size, dtype=np.uint64),
+            rng.integers(0, PRIME, size=size, dtype=np.uint64))
+
+
+def minhash(recipe_ids, ingredient_ids):
+    """Signatures of the recipes of ``(recipe_ids, ingredient_ids)`` pairs
+    sorted by recipe.
+
+    Returns the distinct recipe ids and a ``uint32`` array with a row of
+    ``SIMILAR_NUM_HASHES`` values per recipe.
+    """
+    a, b = hash_functions()
+    recipes, starts = np.unique(recipe_ids, return_index=True)
+    signatures = np.empty((len(recipes), len(a)), dtype=np.uint32)
+    ends = np.append(starts[1:], len(ingredient_ids))
+    for first in range(0, len(recipes), CHUNK_SIZE):
+        last = min(first + CHUNK_SIZE, len(recipes))
+        low, high = starts[first], ends[last - 1]
+        values = np.asarray(ingredient_ids[low:high], dtype=np.uint64)
+        hashes = (np.outer(values, a) + b) % PRIME
+        signatures[first:last] = np.minimum.reduceat(
+            hashes, starts[first:last] - low, axis=0)
+    return recipes, signatures
+
+
+def bucket_keys(signatures):
+    """Bucket of every band of every signature, unique across bands."""
+    bands = settings.SIMILAR_BANDS
+    rows = signatures.shape[1] // bands
+    banded = signatures[:, :bands * rows].reshape(
+        len(signatures), bands, rows).astype(np.uint64)
+    keys = np.broadcast_to(
+        np.arange(bands, dtype=np.uint64), banded.shape[:2]).copy()
+    for row in range(rows):
+        keys = keys * BUCKET_MULTIPLIER + banded[:, :, row]
+    return (keys >> np.uint64(1)).astype(np.int64)
+
+
+def load_signatures(rows):
+    """Recipe ids and signature matrix of ``(recipe_id, minhash)`` rows;
+    signatures of another length are skipped."""
+    size = settings.SIMILAR_NUM_HASHES * 4
+    rows = [(pk, bytes(data)) for pk, data in rows if len(data) == size]
+    recipe_ids = np.array([pk for pk, _ in rows], dtype=np.int64)
+    signatures = np.frombuffer(
+        b''.join(data for _, data in rows), dtype='<u4').reshape(
+        len(rows), settings.SIMILAR_NUM_HASHES)
+    return recipe_ids, signatures
+
+
+def update_signatures(recipe_ids):
+    """Recompute the signatures of ``recipe_ids`` and rewrite the changed
+    ones with their buckets; returns the number of recipes rewritten."""
+    recipe_ids = list(recipe_ids)
+    pairs = np.array(
+        RecipeIngredient.objects.filter(recipe_id__in=recipe_ids).order_by(
+            'recipe_id', 'ingredient_id').values_list(
+            'recipe_id', 'ingredient_id'),
+        dtype=np.int64).reshape(-1, 2)
+    recipes, signatures = minhash(pairs[:, 0], pairs[:, 1])
+    stored = dict(RecipeSignature.objects.filter(
+        recipe_id__in=recipe_ids).values_list('recipe', 'minhash'))
+    encoded = [signature.astype('<u4').tobytes() for signature in signatures]
+    changed = [
+        position for position, recipe_id in enumerate(recipes.tolist())
+        if bytes(stored.pop(recipe_id, b'')) != encoded[position]
+    ]
+    # Recipes left in ``stored`` no longer have ingredients.
+    rewritten = [int(recipes[position]) for position in changed]
+    stale = rewritten + list(stored)
+    if not stale:
+        return 0
+    RecipeBucket.objects.filter(recipe_id__in=stale).delete()
+    RecipeSignature.objects.filter(recipe_id__in=stale).delete()
+    RecipeSignature.objects.bulk_create(
+        RecipeSignature(recipe_id=int(recipes[position]),
+                        minhash=encoded[position])
+        for position in changed)
+    keys = bucket_keys(signatures[changed]).tolist()
+    RecipeBucket.objects.bulk_create(
+        RecipeBucket(recipe_id=recipe_id, bucket=bucket)
+        for recipe_id, buckets in zip(rewritten, keys)
+        for bucket in set(buckets))
+    return len(stale)
+
+
+def similar_recipes(recipe_id, limit, tag_weight=0):
+    """Up to ``limit`` ``(recipe_id, score)`` pairs most similar first.
+
+    The score is the estimated Jaccard similarity of the ingredient sets,
+    plus ``tag_weight`` times the Jaccard similarity of the tag sets.
+    """
+    target_ids, target = load_signatures(RecipeSignature.objects.filter(
+        recipe_id=recipe_id).values_list('recipe', 'minhash'))
+    if not len(target_ids):
+        return []
+    candidates = list(RecipeBucket.objects.filter(
+        bucket__in=bucket_keys(target)[0].tolist()
+    ).exclude(recipe_id=recipe_id).values('recipe').annotate(
+        shared=Count('pk')
+    ).order_by('-shared', '-recipe').values_list(
+        'recipe', flat=True)[:settings.SIMILAR_MAX_CANDIDATES])
+    recipe_ids, signatures = load_signatures(
+        RecipeSignature.objects.filter(
+            recipe_id__in=candidates).values_list('recipe', 'minhash'))
+    if not len(recipe_ids):
+        return []
+    scores = (signatures == target).mean(axis=1)
+    if tag_weight:
+        tags = {}
+        for pk, tag_id in Recipe.tags.through.objects.filter(
+                recipe_id__in=[recipe_id, *recipe_ids.tolist()]
+        ).values_list('recipe_id', 'tag_id'):
+            tags.setdefault(pk, set()).add(tag_id)
+        target_tags = tags.get(recipe_id, set())
+        scores += tag_weight * np.array([
+            len(target_tags & tags.get(pk, set()))
+            / (len(target_tags | tags.get(pk, set())) or 1)
+            for pk in recipe_ids.tolist()
+        ])
+    order = np.lexsort((-recipe_ids, -scores))[:limit]
+    return list(zip(recipe_ids[order].tolist(), scores[order].tolist()))
@@ -0,0 +1,81 @@
+import pytest
+from django.core.cache import caches
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    for cache in caches.all():
+        cache.clear()
+
+
+@pytest.fixture
+def user(django_user_model):
+    return django_user_model.objects.create_user(
+        username='viewer', email='viewer@example.com', password='pass',
+        first_name='View', last_name='Er')
+
+
+@pytest.fixture
+def user_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def tags():
+    Tag.objects.bulk_create([
+        Tag(name=f'Tag {number}', color=f'#00000{number}',
+            slug=f'tag{number}')
+        for number in range(3)
+    ])
+    return list(Tag.objects.order_by('id'))
+
+
+@pytest.fixture
+def ingredients():
+    Ingredient.objects.bulk_create([
+        Ingredient(name=f'Ingredient {number}', measurement_unit='g')
+        for number in range(5)
+    ])
+    return list(Ingredient.objects.order_by('id'))
+
+
+@pytest.fixture
+def make_recipes(django_user_model, tags, ingredients):
+    """Create recipes by several authors, each with two tags and three
+    ingredients."""
+    authors = [
+        django_user_model.objects.create_user(
+            username=f'author{number}', email=f'author{number}@example.com',
+            password='pass', first_name='Au', last_name='Thor')
+        for number in range(3)
+    ]
+
+    def make(count):
+        Recipe.objects.bulk_create([
+            Recipe(author=authors[number % len(authors)],
+                   name=f'Recipe {number}', image='recipes/pizza.jpg',
+                   text='Text', cooking_time=5)
+            for number in range(count)
+        ])
+        recipes = list(Recipe.objects.order_by('-id')[:count])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(
+                recipe=recipe, tag=tags[(recipe.pk + shift) % len(tags)])
+            for recipe in recipes for shift in range(2)
+        ])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient=ingredients[(recipe.pk + shift) % len(
+                    ingredients)],
+                amount=shift + 1)
+            for recipe in recipes for shift in range(3)
+        ])
+        return recipes
+
+    return make
@@ -0,0 +1,67 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Favorite, Recipe, ShoppingList
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/recipes/'
+
+
+def fetch_all(client, params):
+    """Ids of every listed recipe across pages and the SQL that ran."""
+    ids, url = [], URL
+    with CaptureQueriesContext(connection) as context:
+        while url:
+            response = client.get(url, params)
+            assert response.status_code == 200
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            url, params = response.data['next'], None
+    return ids, [query['sql'] for query in context.captured_queries]
+
+
+def tag_slugs(recipe):
+    return set(recipe.tags.values_list('slug', flat=True))
+
+
+@pytest.mark.parametrize('match', [None, 'any', 'all'])
+def test_several_tags_list_each_recipe_once(
+        user_client, make_recipes, match):
+    make_recipes(15)
+    # Every recipe has two of the three tags.
+    wanted = {'tag0', 'tag1'} if match == 'all' else {'tag0', 'tag1', 'tag2'}
+    params = {'tags': sorted(wanted)}
+    if match:
+        params['tags_match'] = match
+    ids, queries = fetch_all(user_client, params)
+
+    assert len(ids) == len(set(ids))
+    expected = {
+        recipe.pk for recipe in Recipe.objects.all()
+        if (wanted <= tag_slugs(recipe) if match == 'all'
+            else wanted & tag_slugs(recipe))
+    }
+    assert expected
+    assert set(ids) == expected
+    assert not any('DISTINCT' in sql.upper() for sql in queries)
+
+
+def test_tags_with_membership_filters_list_each_recipe_once(
+        user, user_client, make_recipes):
+    recipes = make_recipes(15)
+    for recipe in recipes[:10]:
+        Favorite.objects.create(user=user, recipe=recipe)
+        ShoppingList.objects.create(user=user, recipe=recipe)
+    ids, queries = fetch_all(user_client, {
+        'tags': ['tag0', 'tag1'],
+        'is_favorited': 1,
+        'is_in_shopping_cart': 1,
+    })
+
+    assert len(ids) == len(set(ids))
+    assert set(ids) == {
+        recipe.pk for recipe in recipes[:10]
+        if {'tag0', 'tag1'} & tag_slugs(recipe)
+    }
+    assert not any('DISTINCT' in sql.upper() for sql in queries)
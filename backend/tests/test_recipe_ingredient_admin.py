@@ -0,0 +1,69 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.test import Client
+
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCartItem, ShoppingList)
+
+pytestmark = pytest.mark.django_db
+
+URL = '/admin/recipes/recipeingredient/'
+
+
+@pytest.fixture
+def admin_client():
+    admin = get_user_model().objects.create_superuser(
+        username='admin', email='admin@example.com', password='pass',
+        first_name='Ad', last_name='Min')
+    client = Client()
+    client.force_login(admin)
+    return client
+
+
+@pytest.fixture
+def recipe(make_recipes):
+    return make_recipes(1)[0]
+
+
+@pytest.fixture
+def cart_user(recipe):
+    user = get_user_model().objects.create_user(
+        username='cart', email='cart@example.com', password='pass',
+        first_name='Ca', last_name='Rt')
+    ShoppingList.objects.create(user=user, recipe=recipe)
+    return user
+
+
+def cart(user):
+    return dict(ShoppingCartItem.objects.filter(user=user).values_list(
+        'ingredient_id', 'amount'))
+
+
+def test_added_ingredient_is_indexed_and_counted(
+        admin_client, user_client, recipe, cart_user,
+        django_capture_on_commit_callbacks):
+    ingredient = Ingredient.objects.create(
+        name='Saffron', measurement_unit='g')
+    updated_at = recipe.updated_at
+    with django_capture_on_commit_callbacks(execute=True):
+        response = admin_client.post(f'{URL}add/', {
+            'recipe': recipe.pk, 'ingredient': ingredient.pk, 'amount': 4})
+    assert response.status_code == 302
+    assert Recipe.objects.get(pk=recipe.pk).updated_at > updated_at
+    assert cart(cart_user)[ingredient.pk] == 4
+    response = user_client.get('/api/recipes/', {'search': 'saffron'})
+    assert [item['id'] for item in response.data['results']] == [recipe.pk]
+
+
+def test_changed_and_deleted_ingredients_update_carts(
+        admin_client, recipe, cart_user):
+    row = RecipeIngredient.objects.filter(recipe=recipe).first()
+    total = cart(cart_user)[row.ingredient_id]
+    response = admin_client.post(f'{URL}{row.pk}/change/', {
+        'recipe': recipe.pk, 'ingredient': row.ingredient_id,
+        'amount': row.amount + 5})
+    assert response.status_code == 302
+    assert cart(cart_user)[row.ingredient_id] == total + 5
+    response = admin_client.post(f'{URL}{row.pk}/delete/', {'post': 'yes'})
+    assert response.status_code == 302
+    assert cart(cart_user).get(row.ingredient_id, 0) == total - row.amount
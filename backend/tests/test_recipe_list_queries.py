@@ -0,0 +1,30 @@
+import pytest
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/recipes/'
+
+
+def test_recipe_list_query_count_does_not_depend_on_size(
+        user_client, make_recipes, django_assert_num_queries):
+    make_recipes(6)
+    with CaptureQueriesContext(connection) as context:
+        response = user_client.get(URL)
+    assert response.status_code == 200
+    assert len(response.data['results']) == 6
+    expected = len(context.captured_queries)
+
+    for size in (50, 500):
+        make_recipes(size - response.data['count'])
+        # Recipes are bulk created without the signals that invalidate
+        # cached responses.
+        for cache in caches.all():
+            cache.clear()
+        with django_assert_num_queries(expected):
+            response = user_client.get(URL)
+        assert response.status_code == 200
+        assert response.data['count'] == size
+        assert len(response.data['results']) == 6
@@ -0,0 +1,96 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Favorite, Recipe, ShoppingList
+
+pytestmark = pytest.mark.django_db
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAAD'
+    'UlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==')
+
+
+@pytest.fixture
+def recipe(make_recipes, settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    return make_recipes(1)[0]
+
+
+@pytest.fixture
+def author_client(recipe):
+    client = APIClient()
+    client.force_authenticate(recipe.author)
+    return client
+
+
+def put(client, recipe, tags):
+    data = {
+        'name': recipe.name, 'text': recipe.text,
+        'cooking_time': recipe.cooking_time, 'image': IMAGE,
+        'tags': [tag.pk for tag in tags],
+        'ingredients': [
+            {'id': row.ingredient_id, 'amount': row.amount}
+            for row in recipe.recipe_ingredients.all()
+        ],
+    }
+    with CaptureQueriesContext(connection) as context:
+        response = client.put(f'/api/recipes/{recipe.pk}/', data,
+                              format='json')
+    assert response.status_code == 200
+    return [query['sql'] for query in context.captured_queries]
+
+
+def recipe_updates(queries):
+    return [sql for sql in queries
+            if sql.startswith('UPDATE "recipes_recipe" ')]
+
+
+def test_unchanged_image_is_not_written_again(
+        author_client, recipe, tags, tmp_path):
+    put(author_client, recipe, tags[:1])
+    image = Recipe.objects.get(pk=recipe.pk).image.name
+    queries = put(author_client, recipe, tags[:1])
+    assert recipe_updates(queries) == []
+    assert Recipe.objects.get(pk=recipe.pk).image.name == image
+    assert len(list((tmp_path / 'recipes').iterdir())) == 1
+
+
+def test_changed_tags_update_recipe_once(author_client, recipe, tags):
+    put(author_client, recipe, tags[:1])
+    queries = put(author_client, recipe, tags[1:])
+    assert len(recipe_updates(queries)) == 1
+    assert set(Recipe.objects.get(pk=recipe.pk).tags.all()) == set(tags[1:])
+
+
+def test_update_response_keeps_viewer_memberships(author_client, recipe):
+    Favorite.objects.create(user=recipe.author, recipe=recipe)
+    ShoppingList.objects.create(user=recipe.author, recipe=recipe)
+    response = author_client.patch(
+        f'/api/recipes/{recipe.pk}/', {'text': 'Changed'}, format='json')
+    assert response.status_code == 200
+    assert response.data['is_favorited'] is True
+    assert response.data['is_in_shopping_cart'] is True
+
+
+def test_text_patch_updates_recipe_once(author_client, recipe):
+    tags = set(recipe.tags.values_list('pk', flat=True))
+    ingredients = set(recipe.recipe_ingredients.values_list(
+        'pk', 'ingredient_id', 'amount'))
+    with CaptureQueriesContext(connection) as context:
+        response = author_client.patch(
+            f'/api/recipes/{recipe.pk}/', {'text': 'Changed'},
+            format='json')
+    assert response.status_code == 200
+    writes = [query['sql'] for query in context.captured_queries
+              if not query['sql'].startswith(('SELECT', 'SAVEPOINT',
+                                              'RELEASE SAVEPOINT'))]
+    assert len(writes) == 1
+    assert writes[0].startswith('UPDATE "recipes_recipe" SET "text" = ')
+    assert '"updated_at" = ' in writes[0]
+    recipe = Recipe.objects.get(pk=recipe.pk)
+    assert recipe.text == 'Changed'
+    assert set(recipe.tags.values_list('pk', flat=True)) == tags
+    assert set(recipe.recipe_ingredients.values_list(
+        'pk', 'ingredient_id', 'amount')) == ingredients
@@ -0,0 +1,40 @@
+import os
+import time
+
+import pytest
+
+from api.snapshots import ReferenceSnapshot
+from recipes.models import CatalogVersion, Tag
+
+pytestmark = pytest.mark.django_db
+
+
+def snapshot_files(directory):
+    return sorted(name for name in os.listdir(directory)
+                  if name.endswith('.snap'))
+
+
+def test_build_prunes_unused_revisions(settings, tmp_path):
+    settings.REFERENCE_SNAPSHOT_DIR = str(tmp_path)
+    ReferenceSnapshot.loaded.clear()
+    old, recent = tmp_path / 'tags-old.snap', tmp_path / 'tags-recent.snap'
+    old.write_bytes(b'')
+    recent.write_bytes(b'')
+    expired = time.time() - settings.REFERENCE_SNAPSHOT_MAX_AGE - 60
+    os.utime(old, (expired, expired))
+
+    Tag.objects.create(name='Tag', color='#000000', slug='tag')
+    snapshot = ReferenceSnapshot.get(CatalogVersion.get(CatalogVersion.TAGS))
+    current = os.path.basename(ReferenceSnapshot.path(
+        CatalogVersion.TAGS, snapshot.version))
+    assert snapshot_files(tmp_path) == sorted([current, 'tags-recent.snap'])
+
+    # A replaced revision goes once it is unused for the max age.
+    os.utime(tmp_path / current, (expired, expired))
+    Tag.objects.create(name='Other', color='#000001', slug='other')
+    snapshot = ReferenceSnapshot.get(CatalogVersion.get(CatalogVersion.TAGS))
+    latest = os.path.basename(ReferenceSnapshot.path(
+        CatalogVersion.TAGS, snapshot.version))
+    assert latest != current
+    assert snapshot_files(tmp_path) == sorted([latest, 'tags-recent.snap'])
+    assert snapshot.instance(Tag.objects.get(slug='other').pk).name == 'Other'
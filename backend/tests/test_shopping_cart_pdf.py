@@ -0,0 +1,39 @@
+import pytest
+from rest_framework.test import APIClient
+
+from api.pdf import ShoppingListPDF
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/recipes/download_shopping_cart/pdf/{}/'
+
+
+@pytest.fixture
+def stored_pdf(user):
+    """A rendered shopping list of ``user`` and its key."""
+    pdf = ShoppingListPDF()
+    key = pdf.key(user.pk, [('Ingredient 0', 1, 'g')])
+    with open(pdf.path(user.pk, key), 'wb') as file:
+        file.write(b'%PDF-1.4')
+    return key
+
+
+def test_owner_downloads_stored_pdf(user_client, stored_pdf):
+    response = user_client.get(URL.format(stored_pdf))
+    assert response.status_code == 200
+    assert b''.join(response.streaming_content) == b'%PDF-1.4'
+
+
+def test_other_user_cannot_download_pdf(django_user_model, stored_pdf):
+    other = django_user_model.objects.create_user(
+        username='other', email='other@example.com', password='pass',
+        first_name='Oth', last_name='Er')
+    client = APIClient()
+    client.force_authenticate(other)
+    assert client.get(URL.format(stored_pdf)).status_code == 404
+
+
+def test_same_cart_of_other_user_gets_another_key(user):
+    rows = [('Ingredient 0', 1, 'g')]
+    assert ShoppingListPDF.key(user.pk, rows) != ShoppingListPDF.key(
+        user.pk + 1, rows)
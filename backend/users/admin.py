@@ -12,7 +12,9 @@ class UsersAdmin(admin.ModelAdmin):
         'username',
         'email',
         'first_name',
-        'last_name'
+        'last_name',
+        'recipes_count',
+        'followers_count',
     )
     search_fields = ('username', 'email')
     empty_value_display = '-empty-'
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.18 on 2026-10-18 11:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='interactions_changed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Favorites or shopping cart changed'),
+        ),
+    ]
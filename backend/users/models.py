@@ -30,6 +30,20 @@ class User(AbstractUser):
         max_length=254,
         unique=True,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Recipes',
+        default=0,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Followers',
+        default=0,
+    )
+    interactions_changed_at = models.DateTimeField(
+        verbose_name='Favorites or shopping cart changed',
+        null=True,
+        blank=True,
+        db_index=True,
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
 
@@ -58,6 +72,9 @@ class Follow(models.Model):
     class Meta:
         ordering = ['-id']
         verbose_name = 'Subscription'
+        indexes = [
+            models.Index(fields=['user', '-id'], name='follow_user_id_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'author'],